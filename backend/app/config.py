@@ -1,17 +1,22 @@
-from pydantic_settings import BaseSettings
-from typing import List, Union
+from functools import lru_cache
+from typing import Annotated, List
+from pydantic import field_validator, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     """Application settings loaded from environment variables"""
 
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, extra="ignore")
+
     # Supabase Configuration
     supabase_url: str = ""
     supabase_service_key: str = ""
 
     # CORS Configuration
     frontend_url: str = "http://localhost:5173"
-    cors_origins: Union[str, List[str]] = "http://localhost:5173,http://localhost:3000"
+    # NoDecode: CORS_ORIGINS is a comma-separated string, not JSON
+    cors_origins: Annotated[List[str], NoDecode] = ["http://localhost:5173", "http://localhost:3000"]
 
     # Environment
     environment: str = "development"
@@ -19,20 +24,26 @@ class Settings(BaseSettings):
     # API Configuration
     api_prefix: str = "/api"
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-        extra = "ignore"
-    
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
+    @field_validator("cors_origins", mode="before")
+    @classmethod
+    def parse_cors_origins(cls, value):
         # Parse CORS origins from comma-separated string if needed
-        if isinstance(self.cors_origins, str):
-            self.cors_origins = [origin.strip() for origin in self.cors_origins.split(",") if origin.strip()]
-        
+        if isinstance(value, str):
+            return [origin.strip() for origin in value.split(",") if origin.strip()]
+        return value
+
+    @model_validator(mode="after")
+    def include_frontend_url(self):
         # Add frontend_url to CORS origins if not already present
         if self.frontend_url and self.frontend_url not in self.cors_origins:
             self.cors_origins.append(self.frontend_url)
+        return self
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Settings are read from the environment once per process"""
+    return Settings()
 
 
-settings = Settings()
+settings = get_settings()
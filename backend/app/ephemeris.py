@@ -0,0 +1,298 @@
+"""
+Local planetary ephemeris
+Evaluates the DE440s Chebyshev segments in-process with jplephem instead of
+asking JPL Horizons for positions over HTTP. Vectors come out in the same
+frame and units as the Horizons VECTORS queries (ecliptic J2000, AU, AU/day)
+so callers can mix local and Horizons results freely.
+
+DE440s only carries barycenters for Mars and the outer planets, and no outer
+planet satellites; state_vectors() sends those targets to Horizons instead.
+Geocentric RA/dec, distance and magnitude are derived from the same vectors.
+
+The kernel (~32 MB) ships with the worker: bin/post_compile runs
+`python -m app.ephemeris` at build time to download it to KERNEL_PATH, so
+scheduled runs never fetch it from NAIF.
+"""
+
+import os
+import logging
+import httpx
+import numpy as np
+from jplephem.spk import SPK
+from app.horizons import HorizonsBatch
+
+logger = logging.getLogger(__name__)
+
+KERNEL_URL = "https://naif.jpl.nasa.gov/pub/naif/generic_kernels/spk/planets/de440s.bsp"
+# Bundled kernel, written at build time; EPHEMERIS_KERNEL overrides the path
+KERNEL_PATH = os.environ.get(
+    "EPHEMERIS_KERNEL",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "de440s.bsp"),
+)
+
+AU_KM = 149597870.7
+SPEED_OF_LIGHT_AU_DAY = 173.1446326846693
+
+# Mean obliquity of the ecliptic at J2000 (IAU 1976), as used by Horizons
+OBLIQUITY_J2000 = np.radians(84381.448 / 3600)
+_cos_e, _sin_e = np.cos(OBLIQUITY_J2000), np.sin(OBLIQUITY_J2000)
+ICRF_TO_ECLIPTIC = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, _cos_e, _sin_e],
+    [0.0, -_sin_e, _cos_e],
+])
+
+# Horizons command -> NAIF id present in DE440s. Mars and the giant planets
+# map to their system barycenters; the planet-barycenter offset (at most a
+# few hundred km, for Jupiter) is far below what the scene can show.
+SPK_TARGETS = {
+    "10": 10,
+    "199": 199,
+    "299": 299,
+    "399": 399,
+    "301": 301,
+    "499": 4,
+    "599": 5,
+    "699": 6,
+    "799": 7,
+    "899": 8,
+}
+
+_CENTER_ALIASES = {"sun": "10", "ssb": "0", "0": "0"}
+
+# Horizons command -> V(1,0) and phase-law coefficients in (alpha/100 deg),
+# Astronomical Almanac (1984). Saturn ignores the rings; for the Sun the
+# first value is V at 1 AU.
+MAGNITUDES = {
+    "10": (-26.74,),
+    "199": (-0.42, 3.80, -2.73, 2.00),
+    "299": (-4.40, 0.09, 2.39, -0.65),
+    "499": (-1.52, 1.60),
+    "599": (-9.40, 0.50),
+    "699": (-8.88,),
+    "799": (-7.19,),
+    "899": (-6.87,),
+    "301": (0.21, 3.05, -1.02, 1.05),
+    "502": (-1.41,),
+    "503": (-2.09,),
+    "606": (-1.20,),
+}
+
+
+def chebyshev_states(arrays: list[tuple[float, float, np.ndarray]], jd: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate several SPK type 2 segments at jd in one vectorized pass.
+
+    arrays holds each segment's (initial_epoch, interval_length, coefficients)
+    as returned by jplephem's Segment.load_array(), with coefficients shaped
+    (3, intervals, ncoef). Returns positions (km) and velocities (km/day),
+    each shaped (segments, 3).
+    """
+    n_coef = max(coefficients.shape[2] for _, _, coefficients in arrays)
+    # Coefficients of the interval containing jd, zero-padded to a common
+    # degree so all segments stack into one (segments, 3, n_coef) array
+    coeffs = np.zeros((len(arrays), 3, n_coef))
+    s = np.empty(len(arrays))
+    interval_length = np.empty(len(arrays))
+    for i, (initial_epoch, intlen, coefficients) in enumerate(arrays):
+        index, offset = divmod(jd - initial_epoch, intlen)
+        index = int(index)
+        intervals = coefficients.shape[1]
+        if index == intervals:  # jd is exactly the segment end
+            index -= 1
+            offset += intlen
+        if not 0 <= index < intervals:
+            raise ValueError(f"Epoch {jd} outside ephemeris coverage")
+        coeffs[i, :, :coefficients.shape[2]] = coefficients[:, index, :]
+        s[i] = 2.0 * offset / intlen - 1.0
+        interval_length[i] = intlen
+
+    # Chebyshev basis T_k(s) and its derivative dT_k/ds, for every segment
+    basis = np.zeros((len(arrays), n_coef))
+    dbasis = np.zeros((len(arrays), n_coef))
+    basis[:, 0] = 1.0
+    if n_coef > 1:
+        basis[:, 1] = s
+        dbasis[:, 1] = 1.0
+    for k in range(2, n_coef):
+        basis[:, k] = 2.0 * s * basis[:, k - 1] - basis[:, k - 2]
+        dbasis[:, k] = 2.0 * basis[:, k - 1] + 2.0 * s * dbasis[:, k - 1] - dbasis[:, k - 2]
+
+    positions = np.einsum("bcn,bn->bc", coeffs, basis)
+    velocities = np.einsum("bcn,bn->bc", coeffs, dbasis) * (2.0 / interval_length)[:, None]
+    return positions, velocities
+
+
+def _naif_id(command: str) -> int | None:
+    """Map a Horizons command/center ('499', '@sun', '@399') to a kernel id."""
+    command = command.lstrip("@").lower()
+    command = _CENTER_ALIASES.get(command, command)
+    if command == "0":
+        return 0
+    return SPK_TARGETS.get(command)
+
+
+class Ephemeris:
+    """
+    State vectors from an SPK kernel, chained through barycenters.
+
+        ephemeris = Ephemeris(SPK.open("de440s.bsp"))
+        vectors = ephemeris.vectors({"mars": ("499", "@sun")}, jd_tdb)
+    """
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+        # target -> segment giving its state relative to segment.center
+        self._segments = {segment.target: segment for segment in kernel.segments}
+        self._arrays = {}
+
+    def supports(self, command: str, center: str) -> bool:
+        return all(
+            naif is not None and (naif == 0 or naif in self._segments)
+            for naif in (_naif_id(command), _naif_id(center))
+        )
+
+    def _chain(self, naif: int) -> list[int]:
+        """Segment targets summed to reach naif from the SSB."""
+        chain = []
+        while naif != 0:
+            chain.append(naif)
+            naif = self._segments[naif].center
+        return chain
+
+    def _array(self, naif: int) -> tuple[float, float, np.ndarray]:
+        if naif not in self._arrays:
+            self._arrays[naif] = self._segments[naif].load_array()
+        return self._arrays[naif]
+
+    def vectors(self, targets: dict[str, tuple[str, str]], jd: float) -> dict[str, dict]:
+        """
+        Ecliptic state vectors (AU, AU/day) for {body_id: (command, center)}
+        at TDB Julian date jd. Targets the kernel can't serve are left out.
+        """
+        body_ids = [body_id for body_id, (command, center) in targets.items() if self.supports(command, center)]
+        if not body_ids:
+            return {}
+
+        # Each body is a signed sum of segments: +target chain, -center chain.
+        # Collect those into a (bodies, segments) matrix so every segment is
+        # evaluated once and all bodies come out of a single matmul.
+        chains = {}
+        for body_id in body_ids:
+            command, center = targets[body_id]
+            chains[body_id] = (self._chain(_naif_id(command)), self._chain(_naif_id(center)))
+        columns = sorted({naif for plus, minus in chains.values() for naif in plus + minus})
+        column = {naif: i for i, naif in enumerate(columns)}
+        signs = np.zeros((len(body_ids), len(columns)))
+        for row, body_id in enumerate(body_ids):
+            plus, minus = chains[body_id]
+            for naif in plus:
+                signs[row, column[naif]] += 1
+            for naif in minus:
+                signs[row, column[naif]] -= 1
+
+        positions, velocities = chebyshev_states([self._array(naif) for naif in columns], jd)
+        positions = signs @ positions @ ICRF_TO_ECLIPTIC.T / AU_KM
+        velocities = signs @ velocities @ ICRF_TO_ECLIPTIC.T / AU_KM
+
+        return {
+            body_id: {
+                "x": x, "y": y, "z": z,
+                "vx": vx, "vy": vy, "vz": vz,
+            }
+            for body_id, (x, y, z), (vx, vy, vz) in zip(body_ids, positions.tolist(), velocities.tolist())
+        }
+
+
+def _xyz(vectors: dict, prefix: str = "") -> np.ndarray:
+    return np.array([vectors[f"{prefix}x"], vectors[f"{prefix}y"], vectors[f"{prefix}z"]])
+
+
+def apparent_magnitude(command: str, heliocentric: np.ndarray, geocentric: np.ndarray) -> float | None:
+    """V magnitude from the MAGNITUDES phase law, or None for unlisted bodies."""
+    if command not in MAGNITUDES:
+        return None
+    h, *phase_law = MAGNITUDES[command]
+    r = np.linalg.norm(heliocentric)
+    delta = np.linalg.norm(geocentric)
+    if r == 0:  # the Sun
+        return round(h + 5 * np.log10(delta), 3)
+    # Sun-body-Earth angle
+    cos_alpha = np.dot(heliocentric, geocentric) / (r * delta)
+    alpha = np.degrees(np.arccos(np.clip(cos_alpha, -1.0, 1.0))) / 100
+    phase = sum(c * alpha ** (i + 1) for i, c in enumerate(phase_law))
+    return round(float(h + 5 * np.log10(r * delta) + phase), 3)
+
+
+def observer_data(body: dict, earth: dict, command: str) -> dict:
+    """
+    Geocentric RA/dec (deg, ICRF), distance and V magnitude from heliocentric
+    ecliptic state vectors of a body and Earth, corrected for light time.
+    """
+    position = _xyz(body)
+    earth_position = _xyz(earth)
+    light_time = np.linalg.norm(position - earth_position) / SPEED_OF_LIGHT_AU_DAY
+    # Where the body was when the light now reaching Earth left it
+    position = position - _xyz(body, "v") * light_time
+    geocentric = position - earth_position
+
+    delta = float(np.linalg.norm(geocentric))
+    x, y, z = ICRF_TO_ECLIPTIC.T @ geocentric
+    return {
+        "ra": float(np.degrees(np.arctan2(y, x)) % 360),
+        "dec": float(np.degrees(np.arcsin(z / delta))),
+        "distance_au": delta,
+        "distance_km": delta * AU_KM,
+        "magnitude": apparent_magnitude(command, position, geocentric),
+    }
+
+
+def download_kernel(path: str = KERNEL_PATH) -> None:
+    """Download the DE440s kernel to path (build step; see bin/post_compile)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with httpx.stream("GET", KERNEL_URL, timeout=120, follow_redirects=True) as response:
+        response.raise_for_status()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+def load_ephemeris() -> Ephemeris | None:
+    """
+    Open the bundled DE440s kernel. Never downloads it: a missing kernel is a
+    deployment error, logged as such, and callers fall back to Horizons.
+    """
+    try:
+        return Ephemeris(SPK.open(KERNEL_PATH))
+    except Exception as e:
+        logger.error("Ephemeris kernel %s unavailable, using Horizons for every body: %s", KERNEL_PATH, e)
+        return None
+
+
+async def state_vectors(targets: dict[str, tuple[str, str]], jd_tdb: float) -> dict[str, dict | Exception]:
+    """
+    State vectors for {body_id: (command, center)} at TDB Julian date jd_tdb,
+    evaluated locally where the kernel allows and batched to Horizons otherwise.
+    Bodies that failed map to their exception.
+    """
+    ephemeris = load_ephemeris()
+    local = ephemeris.vectors(targets, jd_tdb) if ephemeris else {}
+
+    missing = {body_id: target for body_id, target in targets.items() if body_id not in local}
+    if not missing:
+        return local
+    async with HorizonsBatch(jd_tdb) as batch:
+        remote = await batch.vectors(missing)
+    return {**remote, **local}
+
+
+if __name__ == "__main__":
+    from app.log import configure_logging
+    configure_logging()
+    if os.path.exists(KERNEL_PATH):
+        logger.info("Ephemeris kernel already at %s", KERNEL_PATH)
+    else:
+        logger.info("Downloading %s -> %s", KERNEL_URL, KERNEL_PATH)
+        download_kernel()
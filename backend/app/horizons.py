@@ -0,0 +1,217 @@
+"""
+JPL Horizons API client
+Queries the Horizons HTTP API (format=json) directly with httpx and parses
+the CSV ephemeris block ($$SOE ... $$EOE) without astroquery/astropy Tables.
+Transient failures are retried with backoff, and successful responses are
+cached on disk so re-runs skip the network.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import httpx
+from app.retry import get_with_retry
+
+HORIZONS_API_URL = "https://ssd.jpl.nasa.gov/api/horizons.api"
+
+# Disk cache for raw responses, keyed by (query type, target, center, epoch).
+# Epochs are keyed exactly, so callers that want hits across runs quantize
+# the epoch itself (see EPOCH_DECIMALS) rather than the cache key.
+CACHE_DIR = os.environ.get("HORIZONS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "horizons_cache"))
+CACHE_TTL_SECONDS = 3600
+
+# Decimal places of JD the refresh jobs round their epoch to (~15 min buckets)
+EPOCH_DECIMALS = 2
+
+
+def parse_table(result: str) -> list[dict]:
+    """Parse the CSV ephemeris block of a Horizons text result into row dicts."""
+    if "$$SOE" not in result or "$$EOE" not in result:
+        raise ValueError(f"No ephemeris in Horizons response: {result.strip()[-300:]}")
+
+    header_part, rest = result.split("$$SOE", 1)
+    body = rest.split("$$EOE", 1)[0]
+
+    # Column header is the last non-banner line before $$SOE
+    header_lines = [
+        line for line in header_part.splitlines()
+        if line.strip() and not line.lstrip().startswith("*")
+    ]
+    columns = [c.strip() for c in header_lines[-1].split(",")]
+
+    rows = []
+    for line in body.strip().splitlines():
+        values = [v.strip() for v in line.split(",")]
+        rows.append(dict(zip(columns, values)))
+    return rows
+
+
+def _state(row: dict) -> dict:
+    return {
+        "x": float(row["X"]),
+        "y": float(row["Y"]),
+        "z": float(row["Z"]),
+        "vx": float(row["VX"]),
+        "vy": float(row["VY"]),
+        "vz": float(row["VZ"]),
+    }
+
+
+def parse_vectors(result: str) -> dict:
+    """Extract the first state vector (AU, AU/day) from a VECTORS result."""
+    return _state(parse_table(result)[0])
+
+
+def parse_vector_table(result: str) -> list[dict]:
+    """Extract every state vector row from a VECTORS result, with its epoch."""
+    return [
+        {
+            "jd": float(row["JDTDB"]),
+            "calendar_date": row["Calendar Date (TDB)"],
+            **_state(row),
+        }
+        for row in parse_table(result)
+    ]
+
+
+def result_text(payload: dict) -> str:
+    """Unwrap a format=json API payload, raising on a reported error."""
+    if "error" in payload:
+        raise ValueError(f"Horizons error: {payload['error'].strip()}")
+    return payload["result"]
+
+
+# Fields shared by every VECTORS query; per-request fields are merged on top
+VECTOR_PARAMS = {
+    "format": "json",
+    "OBJ_DATA": "NO",
+    "MAKE_EPHEM": "YES",
+    "EPHEM_TYPE": "VECTORS",
+    # Epochs are TDB Julian dates, the same time scale as the local ephemeris
+    "TIME_TYPE": "TDB",
+    "REF_PLANE": "ECLIPTIC",
+    "REF_SYSTEM": "ICRF",
+    "VEC_TABLE": "2",
+    "VEC_CORR": "NONE",
+    "OUT_UNITS": "AU-D",
+    "CSV_FORMAT": "YES",
+}
+
+
+def vector_params(command: str, center: str, jd: float) -> dict:
+    """Query parameters for a single-epoch ecliptic state vector."""
+    return VECTOR_PARAMS | {"COMMAND": f"'{command}'", "CENTER": f"'{center}'", "TLIST": f"'{jd}'"}
+
+
+def vector_range_params(command: str, center: str, start: str, stop: str, step: str) -> dict:
+    """Query parameters for ecliptic state vectors over start..stop every step."""
+    return VECTOR_PARAMS | {
+        "COMMAND": f"'{command}'",
+        "CENTER": f"'{center}'",
+        "START_TIME": f"'{start}'",
+        "STOP_TIME": f"'{stop}'",
+        "STEP_SIZE": f"'{step}'",
+    }
+
+
+def _cache_path(*key) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{digest}.txt")
+
+
+def _cache_read(path: str) -> str | None:
+    """Return a cached response if present and younger than CACHE_TTL_SECONDS."""
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cache_write(path: str, text: str) -> None:
+    """Best-effort atomic cache write; a read-only disk just disables caching."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+async def _query(client: httpx.AsyncClient, params: dict, cache_key: tuple, parse):
+    """GET a Horizons result, serving from / populating the disk cache."""
+    path = _cache_path(*cache_key)
+    cached = _cache_read(path)
+    if cached is not None:
+        return parse(cached)
+
+    response = await get_with_retry(client, HORIZONS_API_URL, params=params, timeout=30)
+    text = result_text(response.json())
+    result = parse(text)
+    # Only cache responses that parsed, never error pages
+    _cache_write(path, text)
+    return result
+
+
+async def fetch_vectors(client: httpx.AsyncClient, command: str, center: str, jd: float) -> dict:
+    """Fetch the state vector of command relative to center at jd."""
+    return await _query(
+        client,
+        vector_params(command, center, jd),
+        ("vectors", command, center, jd),
+        parse_vectors,
+    )
+
+
+async def fetch_vector_table(client: httpx.AsyncClient, command: str, center: str,
+                             start: str, stop: str, step: str) -> list[dict]:
+    """Fetch state vectors of command relative to center over a date range."""
+    return await _query(
+        client,
+        vector_range_params(command, center, start, stop, step),
+        ("vector_table", command, center, start, stop, step),
+        parse_vector_table,
+    )
+
+
+class HorizonsBatch:
+    """
+    A group of Horizons queries evaluated at one shared epoch (TDB Julian date).
+
+    Horizons accepts a single target per job (including via horizons_file.api),
+    so the batch submits one job per body over a single keep-alive client and
+    returns results keyed by body id. Failed bodies map to their exception.
+
+        async with HorizonsBatch(jd) as batch:
+            vectors = await batch.vectors({"mars": ("499", "@sun")})
+    """
+
+    def __init__(self, jd: float, max_connections: int = 8):
+        self.jd = jd
+        self.max_connections = max_connections
+        self._client: httpx.AsyncClient | None = None
+
+    async def __aenter__(self) -> "HorizonsBatch":
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections))
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._client.aclose()
+        self._client = None
+
+    async def _gather(self, jobs: dict) -> dict[str, dict | Exception]:
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+        return dict(zip(jobs.keys(), results))
+
+    async def vectors(self, targets: dict[str, tuple[str, str]]) -> dict[str, dict | Exception]:
+        """State vectors for {body_id: (command, center)} at the batch epoch."""
+        return await self._gather({
+            body_id: fetch_vectors(self._client, command, center, self.jd)
+            for body_id, (command, center) in targets.items()
+        })
@@ -0,0 +1,33 @@
+"""
+Logging setup for the scheduled refresh scripts
+Records are buffered in memory and written to stdout in batches, flushed early
+on warnings/errors, when a long job calls flush_logs() and at exit, instead of
+one blocking write per print().
+Set LOG_LEVEL=DEBUG for per-body / per-batch progress lines.
+"""
+
+import os
+import sys
+import logging
+from logging.handlers import MemoryHandler
+
+LOG_BUFFER_RECORDS = 64
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(level: str | None = None) -> None:
+    """Route the root logger through a MemoryHandler in front of stdout."""
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    buffered = MemoryHandler(LOG_BUFFER_RECORDS, flushLevel=logging.WARNING, target=stream)
+    logging.basicConfig(
+        level=(level or os.environ.get("LOG_LEVEL", "INFO")).upper(),
+        handlers=[buffered],
+        force=True,
+    )
+
+
+def flush_logs() -> None:
+    """Write out buffered records now, e.g. between batches of a long refresh."""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
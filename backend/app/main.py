@@ -1,12 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.routers import weather
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One upstream client for the process, so cache misses reuse warm connections
+    async with weather.open_meteo_client() as client:
+        app.state.http_client = client
+        yield
+
+
 app = FastAPI(
     title="Solar Studio API",
     description="Backend API for Solar Studio visibility tracking",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -11,6 +11,7 @@ Sources:
 """
 
 import os
+import asyncio
 import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -214,6 +215,24 @@ def get_lunar_eclipse_rows() -> list[dict]:
 
 # ── Main ────────────────────────────────────────────────────────────────
 
+async def fetch_remote_events(year: int) -> list[dict]:
+    """
+    Fetch all remote sources concurrently. The fetchers are blocking and each
+    handles its own errors, so they run side by side in worker threads.
+    """
+    results = await asyncio.gather(
+        # USNO solar eclipses (current + next year)
+        asyncio.to_thread(fetch_usno_solar_eclipses, year),
+        asyncio.to_thread(fetch_usno_solar_eclipses, year + 1),
+        # USNO moon phases (current + next year)
+        asyncio.to_thread(fetch_usno_moon_phases, year),
+        asyncio.to_thread(fetch_usno_moon_phases, year + 1),
+        # NOAA aurora forecast
+        asyncio.to_thread(fetch_noaa_aurora_forecast),
+    )
+    return [row for rows in results for row in rows]
+
+
 def refresh_events():
     """Fetch all event sources and upsert into Supabase."""
     now = datetime.now(timezone.utc)
@@ -222,19 +241,8 @@ def refresh_events():
 
     all_rows: list[dict] = []
 
-    # USNO solar eclipses (current + next year)
-    print("Fetching USNO solar eclipses...")
-    all_rows.extend(fetch_usno_solar_eclipses(year))
-    all_rows.extend(fetch_usno_solar_eclipses(year + 1))
-
-    # USNO moon phases (current + next year)
-    print("Fetching USNO moon phases...")
-    all_rows.extend(fetch_usno_moon_phases(year))
-    all_rows.extend(fetch_usno_moon_phases(year + 1))
-
-    # NOAA aurora forecast
-    print("Fetching NOAA aurora forecast...")
-    all_rows.extend(fetch_noaa_aurora_forecast())
+    print("Fetching USNO solar eclipses, USNO moon phases and NOAA aurora forecast...")
+    all_rows.extend(asyncio.run(fetch_remote_events(year)))
 
     # Static data
     print("Adding meteor showers + lunar eclipses...")
@@ -255,7 +263,7 @@ def refresh_events():
         batch = all_rows[i : i + BATCH]
         try:
             supabase.table("celestial_events").upsert(
-                batch, on_conflict="id"
+                batch, on_conflict="id", returning="minimal"
             ).execute()
             success += len(batch)
         except Exception as e:
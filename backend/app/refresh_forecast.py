@@ -1,25 +1,47 @@
 """
 Weather forecast refresh script
 Fetches hourly forecast data from Open-Meteo (free, no API key) and stores in Supabase
+Batches are fetched concurrently, paced by a token bucket sized to Open-Meteo's limits
+Rows are written straight to Postgres with asyncpg when SUPABASE_DB_URL is set,
+otherwise through PostgREST via supabase-py
 Run via Heroku Scheduler daily
 """
 
 import os
 import time
+import asyncio
+import logging
 import httpx
+import asyncpg
+import orjson
+import numpy as np
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from datetime import datetime, timezone, timedelta
+from app.retry import backoff_delay, is_retryable
+from app.log import configure_logging, flush_logs
 
 load_dotenv()
 
 # Config
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
+# Optional direct Postgres DSN (Supabase "connection string"); skips PostgREST for writes
+SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 GRID_RESOLUTION = 3  # degrees
 BATCH_SIZE = 50  # locations per API call
 FORECAST_DAYS = 5
 
+# Open-Meteo free limits: 10k/day, 5k/hour, 600/min — each location in a
+# batch counts as one call. The bucket refills at 1 call/s with a 500-call
+# burst, so any minute stays under 560 calls and any hour under 4100.
+RATE_LIMIT_PER_SECOND = 1.0
+RATE_LIMIT_BURST = 500
+MAX_CONCURRENT_BATCHES = 4
+UPSERT_CHUNK_ROWS = 1000  # ~8 locations x 120 hours per bulk upsert
+
+OPEN_METEO_URL = "https://api.open-meteo.com"
+
 # Validate config
 if not all([SUPABASE_URL, SUPABASE_KEY]):
     print("Error: Missing required environment variables")
@@ -28,26 +50,58 @@ if not all([SUPABASE_URL, SUPABASE_KEY]):
     exit(1)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
 
-def generate_global_grid():
+def generate_global_grid() -> np.ndarray:
     """
     Generate grid points covering the entire globe at GRID_RESOLUTION spacing.
+    Returns an (N, 2) int array of (lat, lon), latitude-major.
     """
-    grid_points = []
-    lat = -84  # Leaflet Mercator clips at ~85°, skip poles
-    while lat <= 84:
-        lon = -180
-        while lon <= 180:
-            grid_points.append((lat, lon))
-            lon += GRID_RESOLUTION
-        lat += GRID_RESOLUTION
-    return grid_points
-
-
-def fetch_forecast_batch(points: list[tuple[int, int]], max_retries: int = 5) -> list[tuple[tuple[int, int], dict]] | None:
-    """Fetch hourly forecast for multiple locations in one API call, with retry on 429"""
-    url = "https://api.open-meteo.com/v1/forecast"
+    lats = np.arange(-84, 84 + 1, GRID_RESOLUTION)  # Leaflet Mercator clips at ~85°, skip poles
+    lons = np.arange(-180, 180 + 1, GRID_RESOLUTION)
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+    return np.column_stack([lat_grid.ravel(), lon_grid.ravel()])
+
+
+class TokenBucket:
+    """Async token bucket: acquire(n) waits until n tokens have accumulated."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1) -> None:
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+
+        # Lock keeps waiters in FIFO order so large batches aren't starved
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def open_meteo_client() -> httpx.AsyncClient:
+    """Keep-alive client shared by the whole run, one pooled connection per concurrent batch"""
+    return httpx.AsyncClient(
+        base_url=OPEN_METEO_URL,
+        timeout=30,
+        limits=httpx.Limits(max_connections=MAX_CONCURRENT_BATCHES, max_keepalive_connections=MAX_CONCURRENT_BATCHES),
+    )
+
+
+async def fetch_forecast_batch(client: httpx.AsyncClient, limiter: TokenBucket, points: list[tuple[int, int]],
+                               max_retries: int = 5) -> list[tuple[tuple[int, int], dict]] | None:
+    """Fetch hourly forecast for multiple locations in one API call, with retry on 429/5xx"""
     lats = ",".join(str(p[0]) for p in points)
     lons = ",".join(str(p[1]) for p in points)
     params = {
@@ -58,70 +112,73 @@ def fetch_forecast_batch(points: list[tuple[int, int]], max_retries: int = 5) ->
         "timezone": "UTC",
     }
 
-    # Aggressive backoff: 30s, 60s, 120s, 240s, 480s — survives hourly limit resets
-    RETRY_WAITS = [30, 60, 120, 240, 480]
-
     for attempt in range(max_retries):
         try:
-            response = httpx.get(url, params=params, timeout=30)
-            if response.status_code == 429:
-                wait = RETRY_WAITS[min(attempt, len(RETRY_WAITS) - 1)]
-                print(f"  Rate limited, waiting {wait}s (attempt {attempt+1}/{max_retries})...")
-                time.sleep(wait)
-                continue
+            # Every attempt is billed per location, retries included
+            await limiter.acquire(len(points))
+            response = await client.get("/v1/forecast", params=params)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
 
             if isinstance(data, dict):
                 return [(points[0], data)]
 
             return [(points[i], d) for i, d in enumerate(data)]
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429 and attempt < max_retries - 1:
-                wait = RETRY_WAITS[min(attempt, len(RETRY_WAITS) - 1)]
-                print(f"  Rate limited, waiting {wait}s (attempt {attempt+1}/{max_retries})...")
-                time.sleep(wait)
+        except (httpx.HTTPStatusError, httpx.TransportError) as e:
+            if is_retryable(e) and attempt < max_retries - 1:
+                # Aggressive backoff: ~30s, 60s, 120s, 240s, 480s — survives hourly limit resets
+                response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+                wait = backoff_delay(attempt, response, initial=30, maximum=480)
+                if response is not None and response.status_code == 429:
+                    reason = "Rate limited"
+                else:
+                    reason = f"Transient error ({response.status_code if response is not None else type(e).__name__})"
+                logger.warning("%s, waiting %.0fs (attempt %d/%d)", reason, wait, attempt + 1, max_retries)
+                await asyncio.sleep(wait)
                 continue
-            print(f"  Error fetching batch of {len(points)} points: {e}")
+            logger.error("Error fetching batch of %d points: %s", len(points), e)
             return None
         except Exception as e:
-            print(f"  Error fetching batch of {len(points)} points: {e}")
+            logger.error("Error fetching batch of %d points: %s", len(points), e)
             return None
 
     return None
 
 
+def hourly_column(hourly: dict, key: str, length: int, scale: float = 1.0) -> list[float | None]:
+    """Hourly values rounded to 2 decimals, padded to length; None and missing hours stay None"""
+    values = hourly.get(key, [])[:length]
+    column = np.array(values + [None] * (length - len(values)), dtype=np.float64)
+    column = np.round(column / scale, 2)
+    return np.where(np.isnan(column), None, column).tolist()
+
+
 def parse_forecast_rows(data: dict, lat_grid: int, lon_grid: int) -> list[dict]:
     """Parse Open-Meteo hourly response into rows for upsert"""
     hourly = data.get("hourly", {})
     times = hourly.get("time", [])
-    cloud_cover = hourly.get("cloud_cover", [])
-    precipitation = hourly.get("precipitation", [])
-    visibility = hourly.get("visibility", [])
-
-    rows = []
-    now = datetime.now(timezone.utc).isoformat()
+    n = len(times)
 
-    for i, time_str in enumerate(times):
-        # Open-Meteo returns times like "2024-01-15T00:00"
-        forecast_time = time_str + ":00+00:00" if "+" not in time_str else time_str
+    cloud_cover = hourly_column(hourly, "cloud_cover", n)
+    precipitation = hourly_column(hourly, "precipitation", n)
+    visibility_km = hourly_column(hourly, "visibility", n, scale=1000)
 
-        cc = cloud_cover[i] if i < len(cloud_cover) else None
-        pr = precipitation[i] if i < len(precipitation) else None
-        vis_m = visibility[i] if i < len(visibility) else None
-        vis_km = round(vis_m / 1000, 2) if vis_m is not None else None
+    # Open-Meteo returns times like "2024-01-15T00:00" (timezone=UTC), all in one format
+    suffix = ":00+00:00" if times and "+" not in times[0] else ""
+    now = datetime.now(timezone.utc).isoformat()
 
-        rows.append({
+    return [
+        {
             "lat_grid": lat_grid,
             "lon_grid": lon_grid,
-            "forecast_time": forecast_time,
-            "cloud_cover": round(cc, 2) if cc is not None else None,
-            "precipitation": round(pr, 2) if pr is not None else None,
+            "forecast_time": time_str + suffix,
+            "cloud_cover": cc,
+            "precipitation": pr,
             "visibility_km": vis_km,
             "updated_at": now,
-        })
-
-    return rows
+        }
+        for time_str, cc, pr, vis_km in zip(times, cloud_cover, precipitation, visibility_km)
+    ]
 
 
 def upsert_forecast_batch(rows: list[dict], max_retries: int = 3) -> bool:
@@ -133,7 +190,8 @@ def upsert_forecast_batch(rows: list[dict], max_retries: int = 3) -> bool:
         try:
             supabase.table("weather_forecast").upsert(
                 rows,
-                on_conflict="lat_grid,lon_grid,forecast_time"
+                on_conflict="lat_grid,lon_grid,forecast_time",
+                returning="minimal",  # don't echo the rows back
             ).execute()
             return True
         except Exception as e:
@@ -141,24 +199,106 @@ def upsert_forecast_batch(rows: list[dict], max_retries: int = 3) -> bool:
             is_transient = "ssl" in err_str or "connection" in err_str or "timeout" in err_str
             if is_transient and attempt < max_retries - 1:
                 wait = 5 * (attempt + 1)
-                print(f"  Transient error upserting, retrying in {wait}s (attempt {attempt+1}/{max_retries}): {e}")
+                logger.warning("Transient error upserting, retrying in %ds (attempt %d/%d): %s",
+                               wait, attempt + 1, max_retries, e)
                 time.sleep(wait)
                 continue
-            print(f"  Error upserting forecast batch: {e}")
+            logger.error("Error upserting forecast batch: %s", e)
+            return False
+    return False
+
+
+UPSERT_FORECAST_SQL = """
+    INSERT INTO weather_forecast
+        (lat_grid, lon_grid, forecast_time, cloud_cover, precipitation, visibility_km, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (lat_grid, lon_grid, forecast_time) DO UPDATE SET
+        cloud_cover = EXCLUDED.cloud_cover,
+        precipitation = EXCLUDED.precipitation,
+        visibility_km = EXCLUDED.visibility_km,
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+def chunk_location_rows(location_rows: list[list[dict]], max_rows: int = UPSERT_CHUNK_ROWS) -> list[tuple[int, list[dict]]]:
+    """
+    Merge per-location row lists into bulk upsert chunks of at most max_rows,
+    never splitting a location. Returns (location count, rows) per chunk.
+    """
+    chunks = []
+    count, rows = 0, []
+    for point_rows in location_rows:
+        if rows and len(rows) + len(point_rows) > max_rows:
+            chunks.append((count, rows))
+            count, rows = 0, []
+        count += 1
+        rows.extend(point_rows)
+    if count:
+        chunks.append((count, rows))
+    return chunks
+
+
+def forecast_record(row: dict) -> tuple:
+    """Forecast row dict -> positional args for UPSERT_FORECAST_SQL"""
+    return (
+        row["lat_grid"],
+        row["lon_grid"],
+        datetime.fromisoformat(row["forecast_time"]),
+        row["cloud_cover"],
+        row["precipitation"],
+        row["visibility_km"],
+        datetime.fromisoformat(row["updated_at"]),
+    )
+
+
+async def upsert_forecast_batch_pg(pool: asyncpg.Pool, rows: list[dict], max_retries: int = 3) -> bool:
+    """Bulk upsert forecast rows directly into Postgres, with retry on transient errors"""
+    if not rows:
+        return True
+
+    records = [forecast_record(row) for row in rows]
+    for attempt in range(max_retries):
+        try:
+            async with pool.acquire() as conn:
+                await conn.executemany(UPSERT_FORECAST_SQL, records)
+            return True
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError) as e:
+            if attempt < max_retries - 1:
+                wait = 5 * (attempt + 1)
+                logger.warning("Transient error upserting, retrying in %ds (attempt %d/%d): %s",
+                               wait, attempt + 1, max_retries, e)
+                await asyncio.sleep(wait)
+                continue
+            logger.error("Error upserting forecast batch: %s", e)
+            return False
+        except Exception as e:
+            logger.error("Error upserting forecast batch: %s", e)
             return False
     return False
 
 
 def cleanup_old_forecasts():
-    """Delete forecast rows older than 24 hours in the past"""
+    """Drop the daily weather_forecast partitions for past UTC days (migration 013)"""
+    try:
+        result = supabase.rpc("drop_past_weather_forecast_partitions").execute()
+        logger.info("Cleaned up past forecast entries (%s partitions dropped)", result.data)
+    except Exception as e:
+        logger.error("Error cleaning up old forecasts: %s", e)
+
+
+def create_forecast_partitions() -> bool:
+    """Make sure a weather_forecast partition exists for every day the forecast covers"""
+    today = datetime.now(timezone.utc).date()
     try:
-        cutoff = datetime.now(timezone.utc).isoformat()
-        supabase.table("weather_forecast").delete().lt(
-            "forecast_time", cutoff
-        ).execute()
-        print("Cleaned up past forecast entries")
+        supabase.rpc("create_weather_forecast_partitions", {
+            "from_day": today.isoformat(),
+            # One spare day in case Open-Meteo's window runs past midnight UTC
+            "to_day": (today + timedelta(days=FORECAST_DAYS)).isoformat(),
+        }).execute()
+        return True
     except Exception as e:
-        print(f"  Error cleaning up old forecasts: {e}")
+        logger.error("Error creating forecast partitions: %s", e)
+        return False
 
 
 def get_fresh_grid_points() -> set[tuple[float, float]]:
@@ -183,63 +323,91 @@ def get_fresh_grid_points() -> set[tuple[float, float]]:
                 break
             offset += page_size
     except Exception as e:
-        print(f"  Warning: could not check fresh grid points: {e}")
+        logger.warning("Could not check fresh grid points: %s", e)
     return fresh
 
 
+async def refresh_batches(batches: list[list[tuple[int, int]]]) -> tuple[int, int]:
+    """Fetch and store all batches concurrently; returns (success, error) location counts."""
+    limiter = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+    success_count = 0
+    error_count = 0
+
+    # statement_cache_size=0: Supabase's transaction-mode pooler (port 6543)
+    # hands each transaction a different server connection, so cached
+    # prepared statements would collide or go missing between batches
+    pool = await asyncpg.create_pool(
+        SUPABASE_DB_URL, max_size=MAX_CONCURRENT_BATCHES, statement_cache_size=0
+    ) if SUPABASE_DB_URL else None
+
+    async def store(rows: list[dict]) -> bool:
+        if pool:
+            return await upsert_forecast_batch_pg(pool, rows)
+        # supabase-py is synchronous — keep it off the event loop
+        return await asyncio.to_thread(upsert_forecast_batch, rows)
+
+    async def run_batch(client: httpx.AsyncClient, batch_idx: int, batch: list[tuple[int, int]]):
+        nonlocal success_count, error_count
+        async with semaphore:
+            logger.debug("[%d/%d] Fetching batch of %d points", batch_idx + 1, len(batches), len(batch))
+
+            results = await fetch_forecast_batch(client, limiter, batch)
+            if results:
+                location_rows = [parse_forecast_rows(data, lat, lon) for (lat, lon), data in results]
+                # A few bulk upserts per batch instead of one round trip per location
+                for count, rows in chunk_location_rows(location_rows):
+                    if await store(rows):
+                        success_count += count
+                    else:
+                        error_count += count
+            else:
+                error_count += len(batch)
+            # Keep Heroku logs current over the multi-hour run
+            flush_logs()
+
+    try:
+        async with open_meteo_client() as client:
+            await asyncio.gather(*[run_batch(client, i, batch) for i, batch in enumerate(batches)])
+    finally:
+        if pool:
+            await pool.close()
+
+    return success_count, error_count
+
+
 def refresh_forecast():
     """Main refresh function"""
-    print(f"Starting forecast refresh at {datetime.now(timezone.utc).isoformat()}")
-    print(f"Forecast days: {FORECAST_DAYS}")
+    logger.info("Starting forecast refresh at %s", datetime.now(timezone.utc).isoformat())
+    logger.info("Forecast days: %d", FORECAST_DAYS)
 
-    grid_points = generate_global_grid()
-    print(f"Generated {len(grid_points)} total grid points")
+    grid_points = [tuple(p) for p in generate_global_grid().tolist()]
+    logger.info("Generated %d total grid points", len(grid_points))
 
     # Clean up old data first
     cleanup_old_forecasts()
+    # Rows for a day without a partition would be rejected by Postgres
+    if not create_forecast_partitions():
+        return
 
     # Skip locations that already have fresh forecast data (2+ days out)
     fresh = get_fresh_grid_points()
     if fresh:
         grid_points = [p for p in grid_points if p not in fresh]
-        print(f"Skipping {len(fresh)} grid points with fresh data, {len(grid_points)} to fetch")
-
-    success_count = 0
-    error_count = 0
+        logger.info("Skipping %d grid points with fresh data, %d to fetch", len(fresh), len(grid_points))
 
     # Batch into chunks of BATCH_SIZE
     batches = [grid_points[i:i + BATCH_SIZE] for i in range(0, len(grid_points), BATCH_SIZE)]
-    print(f"Split into {len(batches)} batches of up to {BATCH_SIZE} locations each")
-
-    # Open-Meteo free limits: 10k/day, 5k/hour, 600/min
-    # Each location in a batch = 1 API call. ~6897 pts = 138 batches × 50.
-    # At 1 batch/75s → 48 batches/hour → 2400 calls/hour (well under 5k).
-    # Total runtime: 138 × 75s ≈ 2.9 hours.
-    BATCH_DELAY = 75  # seconds between batches
-
-    for batch_idx, batch in enumerate(batches):
-        print(f"[{batch_idx+1}/{len(batches)}] Fetching batch of {len(batch)} points...")
-
-        results = fetch_forecast_batch(batch)
-        if results:
-            for (lat, lon), forecast_data in results:
-                rows = parse_forecast_rows(forecast_data, lat, lon)
-                if upsert_forecast_batch(rows):
-                    success_count += 1
-                else:
-                    error_count += 1
-        else:
-            error_count += len(batch)
+    logger.info("Split into %d batches of up to %d locations each", len(batches), BATCH_SIZE)
 
-        if batch_idx < len(batches) - 1:
-            time.sleep(BATCH_DELAY)
+    # ~6897 pts: first 500 go out immediately, then 1 location/s → ≈1.8 hours
+    # (previously a fixed 75s gap per batch, ≈2.9 hours).
+    success_count, error_count = asyncio.run(refresh_batches(batches))
 
-    print(f"\nForecast refresh complete!")
-    print(f"  Success: {success_count}")
-    print(f"  Errors: {error_count}")
-    print(f"  Total: {len(grid_points)}")
-    print(f"  API calls: {len(batches)}")
+    logger.info("Forecast refresh complete: %d ok, %d failed, %d total, %d API calls",
+                success_count, error_count, len(grid_points), len(batches))
 
 
 if __name__ == "__main__":
+    configure_logging()
     refresh_forecast()
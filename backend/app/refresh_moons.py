@@ -1,17 +1,25 @@
 """
 Moon position refresh script
-Fetches moon positions relative to their parent planet from JPL Horizons.
+Computes moon positions relative to their parent planet from the local
+DE440s ephemeris where it covers them (Earth's Moon), and from JPL Horizons
+for the rest. Geocentric RA/dec/distance/magnitude are derived from those
+offsets plus the heliocentric vectors of the parents and Earth.
 Stores parent-relative offsets directly — the frontend positions moons
 relative to their parent's scene position.
+Horizons queries go out as one batch at a single shared epoch.
 Run hourly via scheduler.
 """
 
 import os
+import asyncio
+import logging
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from astroquery.jplhorizons import Horizons
 from astropy.time import Time
+from app.ephemeris import state_vectors, observer_data
+from app.horizons import EPOCH_DECIMALS
+from app.log import configure_logging
 
 load_dotenv()
 
@@ -23,6 +31,7 @@ if not all([SUPABASE_URL, SUPABASE_KEY]):
     exit(1)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
 # (id, name, jpl_id, parent_id, parent_jpl_id, radius_km)
 MOONS = [
@@ -33,51 +42,59 @@ MOONS = [
 ]
 
 
-def fetch_moon(name: str, jpl_id: str, parent_jpl_id: str) -> dict | None:
-    """Fetch moon position relative to its parent planet."""
-    try:
-        now = Time.now()
-
-        # Query moon position relative to parent planet center
-        vectors = Horizons(
-            id=jpl_id,
-            location=f'@{parent_jpl_id}',
-            epochs=now.jd,
-        ).vectors()
-
-        # Also get geocentric observer data for the 2D map
-        ephem = Horizons(id=jpl_id, location='500', epochs=now.jd).ephemerides()
-
-        return {
-            # Offset from parent (AU)
-            "offset_x": float(vectors['x'][0]),
-            "offset_y": float(vectors['y'][0]),
-            "offset_z": float(vectors['z'][0]),
-            "vx": float(vectors['vx'][0]),
-            "vy": float(vectors['vy'][0]),
-            "vz": float(vectors['vz'][0]),
-            # Observer data
-            "ra": float(ephem['RA'][0]),
-            "dec": float(ephem['DEC'][0]),
-            "distance_au": float(ephem['delta'][0]),
-            "distance_km": float(ephem['delta'][0]) * 149597870.7,
-            "magnitude": float(ephem['V'][0]) if 'V' in ephem.colnames and ephem['V'][0] else None,
-        }
-    except Exception as e:
-        print(f"  Error fetching {name}: {e}")
-        return None
+async def fetch_all_moons(jd_tdb: float) -> dict:
+    """Fetch parent-relative moon vectors + heliocentric parent and Earth vectors at jd_tdb."""
+    targets = {
+        # Moon position relative to parent planet center
+        **{moon_id: (jpl_id, f"@{parent_jpl_id}") for moon_id, _, jpl_id, _, parent_jpl_id, _ in MOONS},
+        # Heliocentric parents and Earth, to place each moon for the 2D map
+        "earth": ("399", "@sun"),
+        **{parent_id: (parent_jpl_id, "@sun") for _, _, _, parent_id, parent_jpl_id, _ in MOONS},
+    }
+    return await state_vectors(targets, jd_tdb)
+
+
+def moon_data(name: str, jpl_id: str, vectors: dict | Exception,
+              parent: dict | Exception, earth: dict | Exception) -> dict | None:
+    """Combine one moon's parent-relative vectors with derived observer fields."""
+    for part in (vectors, parent, earth):
+        if isinstance(part, Exception):
+            logger.error("Error fetching %s: %s", name, part)
+            return None
+
+    heliocentric = {key: parent[key] + vectors[key] for key in ("x", "y", "z", "vx", "vy", "vz")}
+    ephem = observer_data(heliocentric, earth, jpl_id)
+
+    return {
+        # Offset from parent (AU)
+        "offset_x": vectors["x"],
+        "offset_y": vectors["y"],
+        "offset_z": vectors["z"],
+        "vx": vectors["vx"],
+        "vy": vectors["vy"],
+        "vz": vectors["vz"],
+        # Observer data
+        **ephem,
+    }
 
 
 def refresh_moons():
-    print(f"[Moons] Starting refresh at {datetime.now(timezone.utc).isoformat()}")
+    logger.info("Starting moon refresh at %s", datetime.now(timezone.utc).isoformat())
 
     success = 0
     errors = 0
 
-    for moon_id, name, jpl_id, parent_id, parent_jpl_id, radius in MOONS:
-        print(f"  Fetching {name} (parent: {parent_id})...")
+    logger.info("Fetching %d moons", len(MOONS))
+    # One epoch for every body: each moon's offset is added to its parent's position;
+    # rounded so reruns within the bucket hit the Horizons disk cache
+    jd_tdb = round(Time.now().tdb.jd, EPOCH_DECIMALS)
+    vectors = asyncio.run(fetch_all_moons(jd_tdb))
+
+    records = []
+    updated_at = datetime.now(timezone.utc).isoformat()
 
-        data = fetch_moon(name, jpl_id, parent_jpl_id)
+    for moon_id, name, jpl_id, parent_id, parent_jpl_id, radius in MOONS:
+        data = moon_data(name, jpl_id, vectors[moon_id], vectors[parent_id], vectors["earth"])
         if not data:
             errors += 1
             continue
@@ -85,7 +102,7 @@ def refresh_moons():
         # Store parent-relative offset directly in x/y/z.
         # The frontend knows to treat these as offsets via parent_body field.
         # Velocity is also parent-relative (from Horizons query centered on parent).
-        record = {
+        records.append({
             "id": moon_id,
             "name": name,
             "type": "moon",
@@ -98,19 +115,24 @@ def refresh_moons():
             "distance_au": data["distance_au"],
             "distance_km": data["distance_km"],
             "magnitude": data["magnitude"],
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-        }
-
+            "updated_at": updated_at,
+        })
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("✓ %s: offset=(%.6f, %.6f, %.6f) AU",
+                         name, data["offset_x"], data["offset_y"], data["offset_z"])
+
+    # One bulk upsert instead of a PostgREST round trip per moon
+    if records:
         try:
-            supabase.table("celestial_objects").upsert(record, on_conflict="id").execute()
-            success += 1
-            print(f"    ✓ {name}: offset=({data['offset_x']:.6f}, {data['offset_y']:.6f}, {data['offset_z']:.6f}) AU")
+            supabase.table("celestial_objects").upsert(records, on_conflict="id", returning="minimal").execute()
+            success += len(records)
         except Exception as e:
-            errors += 1
-            print(f"    ✗ Upsert failed: {e}")
+            errors += len(records)
+            logger.error("Upsert failed: %s", e)
 
-    print(f"\n[Moons] Done — {success} ok, {errors} failed, {len(MOONS)} total")
+    logger.info("Moons done: %d ok, %d failed, %d total", success, errors, len(MOONS))
 
 
 if __name__ == "__main__":
+    configure_logging()
     refresh_moons()
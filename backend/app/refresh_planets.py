@@ -1,15 +1,21 @@
 """
 Planet position refresh script
-Fetches heliocentric positions (relative to Sun) from JPL Horizons.
+Computes heliocentric positions (relative to Sun) from the local DE440s
+ephemeris, falling back to JPL Horizons for anything it can't serve.
+Geocentric RA/dec/distance/magnitude are derived from the same vectors.
 Run daily via scheduler.
 """
 
 import os
+import asyncio
+import logging
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from astroquery.jplhorizons import Horizons
 from astropy.time import Time
+from app.ephemeris import state_vectors, observer_data
+from app.horizons import EPOCH_DECIMALS
+from app.log import configure_logging
 
 load_dotenv()
 
@@ -21,6 +27,7 @@ if not all([SUPABASE_URL, SUPABASE_KEY]):
     exit(1)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+logger = logging.getLogger(__name__)
 
 # (id, name, type, jpl_id, radius_km)
 PLANETS = [
@@ -36,80 +43,77 @@ PLANETS = [
 ]
 
 
-def fetch_planet(obj_id: str, name: str, jpl_id: str) -> dict | None:
-    """Fetch heliocentric vectors + geocentric observer data for a planet."""
-    try:
-        now = Time.now()
+async def fetch_all_planets(jd_tdb: float) -> dict:
+    """Fetch heliocentric vectors (position relative to Sun) for every planet at jd_tdb."""
+    return await state_vectors({obj_id: (jpl_id, "@sun") for obj_id, _, _, jpl_id, _ in PLANETS}, jd_tdb)
 
-        # Heliocentric vectors (position relative to Sun)
-        vectors = Horizons(id=jpl_id, location='@sun', epochs=now.jd).vectors()
 
-        result = {
-            "x": float(vectors['x'][0]),
-            "y": float(vectors['y'][0]),
-            "z": float(vectors['z'][0]),
-            "vx": float(vectors['vx'][0]),
-            "vy": float(vectors['vy'][0]),
-            "vz": float(vectors['vz'][0]),
-        }
+def planet_data(obj_id: str, name: str, jpl_id: str, vectors: dict | Exception, earth: dict | Exception) -> dict | None:
+    """Heliocentric vectors plus geocentric observer data (for the 2D sky map)."""
+    for part in (vectors, earth):
+        if isinstance(part, Exception):
+            logger.error("Error fetching %s: %s", name, part)
+            return None
 
-        # Geocentric observer data (RA/dec/distance for 2D sky map)
+    if obj_id == "earth":
         # Can't observe Earth from Earth
-        if obj_id != "earth":
-            ephem = Horizons(id=jpl_id, location='500', epochs=now.jd).ephemerides()
-            result.update({
-                "ra": float(ephem['RA'][0]),
-                "dec": float(ephem['DEC'][0]),
-                "distance_au": float(ephem['delta'][0]),
-                "distance_km": float(ephem['delta'][0]) * 149597870.7,
-                "magnitude": float(ephem['V'][0]) if 'V' in ephem.colnames and ephem['V'][0] else None,
-            })
-        else:
-            result.update({
-                "ra": None, "dec": None,
-                "distance_au": 0, "distance_km": 0,
-                "magnitude": None,
-            })
+        ephem = {
+            "ra": None, "dec": None,
+            "distance_au": 0, "distance_km": 0,
+            "magnitude": None,
+        }
+    else:
+        ephem = observer_data(vectors, earth, jpl_id)
 
-        return result
-    except Exception as e:
-        print(f"  Error fetching {name}: {e}")
-        return None
+    return {**vectors, **ephem}
 
 
 def refresh_planets():
-    print(f"[Planets] Starting refresh at {datetime.now(timezone.utc).isoformat()}")
+    logger.info("Starting planet refresh at %s", datetime.now(timezone.utc).isoformat())
 
     success = 0
     errors = 0
 
+    logger.info("Fetching %d planets", len(PLANETS))
+    # One epoch for every body, so relative positions are self-consistent;
+    # rounded so reruns within the bucket hit the Horizons disk cache
+    jd_tdb = round(Time.now().tdb.jd, EPOCH_DECIMALS)
+    vectors = asyncio.run(fetch_all_planets(jd_tdb))
+
+    records = []
+    updated_at = datetime.now(timezone.utc).isoformat()
+
     for obj_id, name, obj_type, jpl_id, radius in PLANETS:
-        print(f"  Fetching {name}...")
-        data = fetch_planet(obj_id, name, jpl_id)
+        data = planet_data(obj_id, name, jpl_id, vectors[obj_id], vectors["earth"])
 
         if data:
-            record = {
+            records.append({
                 "id": obj_id,
                 "name": name,
                 "type": obj_type,
                 "jpl_horizons_id": jpl_id,
                 "parent_body": None,
                 "radius_km": radius,
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": updated_at,
                 **data,
-            }
-            try:
-                supabase.table("celestial_objects").upsert(record, on_conflict="id").execute()
-                success += 1
-                print(f"    ✓ {name}: x={data['x']:.4f}, y={data['y']:.4f}, z={data['z']:.4f} AU")
-            except Exception as e:
-                errors += 1
-                print(f"    ✗ Upsert failed: {e}")
+            })
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("✓ %s: x=%.4f, y=%.4f, z=%.4f AU", name, data["x"], data["y"], data["z"])
         else:
             errors += 1
 
-    print(f"\n[Planets] Done — {success} ok, {errors} failed, {len(PLANETS)} total")
+    # One bulk upsert instead of a PostgREST round trip per planet
+    if records:
+        try:
+            supabase.table("celestial_objects").upsert(records, on_conflict="id", returning="minimal").execute()
+            success += len(records)
+        except Exception as e:
+            errors += len(records)
+            logger.error("Upsert failed: %s", e)
+
+    logger.info("Planets done: %d ok, %d failed, %d total", success, errors, len(PLANETS))
 
 
 if __name__ == "__main__":
+    configure_logging()
     refresh_planets()
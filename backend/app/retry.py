@@ -0,0 +1,51 @@
+"""
+Retry policy for outbound HTTP calls
+Exponential backoff with jitter for transient failures (429/5xx responses,
+connection errors and timeouts), honouring Retry-After when the server sends it.
+"""
+
+import random
+import asyncio
+import httpx
+
+MAX_ATTEMPTS = 5
+INITIAL_WAIT = 1  # seconds
+MAX_WAIT = 60  # seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True for transport errors and 429/5xx responses."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+def backoff_delay(attempt: int, response: httpx.Response | None = None,
+                  initial: float = INITIAL_WAIT, maximum: float = MAX_WAIT) -> float:
+    """Seconds to wait before retry number attempt+1."""
+    # Server-provided Retry-After (delta-seconds form) wins over our schedule,
+    # still capped so one response can't stall a refresh job
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(maximum, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return min(maximum, initial * 2 ** attempt + random.uniform(0, 1))
+
+
+async def get_with_retry(client: httpx.AsyncClient, url: str, *, max_attempts: int = MAX_ATTEMPTS,
+                         initial: float = INITIAL_WAIT, maximum: float = MAX_WAIT, **kwargs) -> httpx.Response:
+    """client.get() that raises for status and retries transient failures."""
+    for attempt in range(max_attempts):
+        try:
+            response = await client.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+        except (httpx.HTTPStatusError, httpx.TransportError) as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+            response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+            await asyncio.sleep(backoff_delay(attempt, response, initial, maximum))
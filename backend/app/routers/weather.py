@@ -3,19 +3,151 @@ Weather API endpoint using Open-Meteo (free, no API key)
 with in-memory caching and neighbor lookup
 """
 
+import os
 import time
+import asyncio
 import math
+import tempfile
 import httpx
-from fastapi import APIRouter, HTTPException
+import orjson
+import numpy as np
+from cachetools import TTLCache
+from hishel import AsyncSqliteStorage
+from hishel.httpx import AsyncCacheTransport
+from scipy.spatial import cKDTree
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
+from functools import lru_cache
+from supabase import create_client, Client
+from app.config import get_settings
 
 router = APIRouter()
 
-# In-memory cache: {cache_key: {data, timestamp, lat, lon}}
-weather_cache: dict = {}
 CACHE_TTL_SECONDS = 3600  # 1 hour
+CACHE_MAX_ENTRIES = 10_000
 NEIGHBOR_RADIUS_KM = 50  # Return cached if within 50km
+EARTH_RADIUS_KM = 6371
+HTTP_MAX_KEEPALIVE = 20
+# Pending writes/removals before the neighbor KD-tree is rebuilt
+INDEX_REBUILD_THRESHOLD = 256
+
+# HTTP cache for upstream responses, honouring their Cache-Control/ETag
+# headers. It lives on disk so it survives restarts and is shared by workers;
+# rows are dropped after CACHE_TTL_SECONDS so one per lat/lon can't pile up.
+HTTP_CACHE_PATH = os.environ.get(
+    "WEATHER_HTTP_CACHE", os.path.join(tempfile.gettempdir(), "weather_http_cache.db")
+)
+
+
+class WeatherCache(TTLCache):
+    """
+    In-memory cache: {cache_key: {data, lat, lon}}, bounded in size, with
+    entries expiring CACHE_TTL_SECONDS after they were written.
+    Cached points are indexed in a KD-tree over their unit-sphere positions,
+    so neighbor lookup is O(log N) instead of a scan of every entry. Each
+    position is computed once on insert. New points wait in a small pending
+    buffer that lookups scan linearly; the tree is only rebuilt once
+    INDEX_REBUILD_THRESHOLD writes/removals have accumulated, so a cache miss
+    doesn't pay for a full rebuild.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 timer=time.monotonic):
+        super().__init__(maxsize, ttl, timer)
+        self._points: dict = {}
+        self._pending: dict = {}  # written since the last rebuild, not in the tree
+        self._indexed: set = set()  # keys in the tree
+        self._dead = 0  # tree entries since removed or overwritten
+        self._tree_keys: list = []
+        self._tree: Optional[cKDTree] = None
+
+    def __setitem__(self, key, entry):
+        super().__setitem__(key, entry)
+        point = unit_vectors(entry['lat'], entry['lon'])
+        self._points[key] = point
+        self._pending[key] = point
+        self._forget(key)
+
+    def __delitem__(self, key):
+        self._points.pop(key, None)
+        self._pending.pop(key, None)
+        self._forget(key)
+        super().__delitem__(key)
+
+    def expire(self, time=None):
+        # TTLCache drops expired entries here without going through __delitem__
+        expired = super().expire(time)
+        for key, _ in expired:
+            self._points.pop(key, None)
+            self._pending.pop(key, None)
+            self._forget(key)
+        return expired
+
+    def clear(self):
+        super().clear()
+        self._points.clear()
+        self._pending.clear()
+        self._indexed.clear()
+        self._dead = 0
+        self._tree_keys = []
+        self._tree = None
+
+    def stored_entries(self) -> int:
+        """Entries held, including expired ones not yet purged (len() purges)"""
+        return len(self._points)
+
+    def _forget(self, key):
+        """Mark the tree's copy of key (if any) as superseded"""
+        if key in self._indexed:
+            self._indexed.discard(key)
+            self._dead += 1
+
+    def _rebuild(self):
+        self._tree_keys = list(self._points)
+        self._tree = cKDTree(np.array(list(self._points.values()))) if self._tree_keys else None
+        self._indexed = set(self._tree_keys)
+        self._pending.clear()
+        self._dead = 0
+
+    def nearest(self, lat: float, lon: float, radius_km: float) -> Optional[tuple[int, int]]:
+        """Key of the closest cached point within radius_km, possibly expired"""
+        if len(self._pending) + self._dead >= INDEX_REBUILD_THRESHOLD:
+            self._rebuild()
+        query = unit_vectors(lat, lon)
+        # Great-circle radius -> straight-line distance between unit vectors
+        chord = 2 * math.sin(radius_km / (2 * EARTH_RADIUS_KM))
+        candidates = []
+
+        if self._tree is not None:
+            # Every tree point in range, since the closest may be superseded
+            for i in self._tree.query_ball_point(query, chord):
+                key = self._tree_keys[i]
+                if key in self._indexed:
+                    candidates.append((float(np.linalg.norm(self._tree.data[i] - query)), key))
+
+        if self._pending:
+            keys = list(self._pending)
+            distances = np.linalg.norm(np.array(list(self._pending.values())) - query, axis=1)
+            i = int(np.argmin(distances))
+            if distances[i] <= chord:
+                candidates.append((float(distances[i]), keys[i]))
+
+        return min(candidates)[1] if candidates else None
+
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    """Points on the unit sphere for lat/lon in degrees (scalars or arrays)"""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    cos_lat = np.cos(lat_rad)
+    return np.stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)], axis=-1)
+
+
+weather_cache = WeatherCache()
+
+# cache_key -> fetch in progress, so concurrent misses share one upstream call
+_in_flight: dict[tuple[int, int], asyncio.Task] = {}
 
 
 class WeatherResponse(BaseModel):
@@ -29,42 +161,51 @@ class WeatherResponse(BaseModel):
     lon: float
 
 
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two points in km"""
-    R = 6371
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-
 def find_nearest_cached(lat: float, lon: float) -> Optional[dict]:
     """Find nearest cached weather within NEIGHBOR_RADIUS_KM"""
-    now = time.time()
-    nearest = None
-    nearest_dist = float('inf')
+    key = weather_cache.nearest(lat, lon, NEIGHBOR_RADIUS_KM)
+    if key is None:
+        return None
+    entry = weather_cache.get(key)
+    if entry is None:
+        # Expire lazily: only when the nearest hit is stale, then look again
+        weather_cache.expire()
+        key = weather_cache.nearest(lat, lon, NEIGHBOR_RADIUS_KM)
+        entry = weather_cache.get(key) if key is not None else None
+    return entry
+
+
+def cached_transport(transport: Optional[httpx.AsyncBaseTransport] = None) -> AsyncCacheTransport:
+    """Wrap a transport with the on-disk HTTP cache"""
+    return AsyncCacheTransport(
+        transport or httpx.AsyncHTTPTransport(),
+        storage=AsyncSqliteStorage(database_path=HTTP_CACHE_PATH, default_ttl=CACHE_TTL_SECONDS),
+    )
+
+
+def open_meteo_client() -> httpx.AsyncClient:
+    """Client shared by all requests for the app's lifetime (see main.lifespan)"""
+    transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE))
+    return httpx.AsyncClient(transport=cached_transport(transport), timeout=10)
 
-    for key, entry in list(weather_cache.items()):
-        if now - entry['timestamp'] > CACHE_TTL_SECONDS:
-            del weather_cache[key]
-            continue
-        dist = haversine_distance(lat, lon, entry['lat'], entry['lon'])
-        if dist < NEIGHBOR_RADIUS_KM and dist < nearest_dist:
-            nearest = entry
-            nearest_dist = dist
 
-    return nearest
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
 
 
-def cache_key(lat: float, lon: float) -> str:
-    """Generate cache key rounded to 0.1 degrees"""
-    return f"{round(lat, 1)},{round(lon, 1)}"
+@lru_cache
+def get_supabase() -> Client:
+    """Service-role client, created on first use and reused across requests"""
+    settings = get_settings()
+    return create_client(settings.supabase_url, settings.supabase_service_key)
 
 
-async def fetch_weather_from_open_meteo(lat: float, lon: float) -> dict:
+def cache_key(lat: float, lon: float) -> tuple[int, int]:
+    """Generate cache key: lat/lon in whole tenths of a degree"""
+    return round(lat * 10), round(lon * 10)
+
+
+async def fetch_weather_from_open_meteo(client: httpx.AsyncClient, lat: float, lon: float) -> dict:
     """Fetch current weather from Open-Meteo (free, no API key)"""
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
@@ -76,10 +217,30 @@ async def fetch_weather_from_open_meteo(lat: float, lon: float) -> dict:
         "timezone": "UTC",
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+    response = await client.get(url, params=params)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+async def _fetch_and_cache(client: httpx.AsyncClient, key: tuple[int, int], lat: float, lon: float) -> dict:
+    raw_data = await fetch_weather_from_open_meteo(client, lat, lon)
+    parsed = parse_open_meteo_response(raw_data, lat, lon)
+    weather_cache[key] = {
+        'data': parsed,
+        'lat': lat,
+        'lon': lon
+    }
+    return parsed
+
+
+def fetch_weather_once(client: httpx.AsyncClient, key: tuple[int, int], lat: float, lon: float) -> asyncio.Task:
+    """Fetch and cache weather for key, or join the fetch already in flight for it"""
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_cache(client, key, lat, lon))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return task
 
 
 def parse_open_meteo_response(data: dict, lat: float, lon: float) -> dict:
@@ -109,37 +270,29 @@ def parse_open_meteo_response(data: dict, lat: float, lon: float) -> dict:
 
 
 @router.get("/weather", response_model=WeatherResponse)
-async def get_weather(lat: float, lon: float):
+async def get_weather(lat: float, lon: float,
+                      client: httpx.AsyncClient = Depends(get_http_client)):
     """
     Get weather for a specific location.
     Uses Open-Meteo with in-memory cache and neighbor lookup.
     """
     key = cache_key(lat, lon)
-    now = time.time()
 
-    # Check exact cache hit
-    if key in weather_cache:
-        entry = weather_cache[key]
-        if now - entry['timestamp'] < CACHE_TTL_SECONDS:
-            return WeatherResponse(**entry['data'], source='cache')
+    # Check exact cache hit (expired entries read as missing). Cached data was
+    # validated when it was fetched, so cache and neighbor hits skip validation
+    entry = weather_cache.get(key)
+    if entry is not None:
+        return WeatherResponse.model_construct(**entry['data'], source='cache')
 
     # Check neighbor cache
     neighbor = find_nearest_cached(lat, lon)
     if neighbor:
-        return WeatherResponse(**neighbor['data'], source='neighbor')
+        return WeatherResponse.model_construct(**neighbor['data'], source='neighbor')
 
-    # Cache miss - fetch from Open-Meteo
+    # Cache miss - fetch from Open-Meteo. Shielded so a client disconnecting
+    # doesn't cancel the fetch other requests for this key are waiting on.
     try:
-        raw_data = await fetch_weather_from_open_meteo(lat, lon)
-        parsed = parse_open_meteo_response(raw_data, lat, lon)
-
-        weather_cache[key] = {
-            'data': parsed,
-            'timestamp': now,
-            'lat': lat,
-            'lon': lon
-        }
-
+        parsed = await asyncio.shield(fetch_weather_once(client, key, lat, lon))
         return WeatherResponse(**parsed, source='api')
 
     except httpx.HTTPError as e:
@@ -147,16 +300,12 @@ async def get_weather(lat: float, lon: float):
 
 
 @router.get("/weather/forecast", response_model=WeatherResponse)
-async def get_weather_forecast(lat: float, lon: float, time_iso: str):
+async def get_weather_forecast(lat: float, lon: float, time_iso: str,
+                               sb: Client = Depends(get_supabase)):
     """
     Get forecast weather for a location and future time.
     Looks up the nearest hourly forecast from weather_forecast table.
     """
-    from app.config import settings
-    from supabase import create_client
-
-    sb = create_client(settings.supabase_url, settings.supabase_service_key)
-
     grid_res = 5
     lat_grid = round(lat / grid_res) * grid_res
     lon_grid = round(lon / grid_res) * grid_res
@@ -172,16 +321,18 @@ async def get_weather_forecast(lat: float, lon: float, time_iso: str):
             "forecast_time", time_iso
         ).order(
             "forecast_time"
-        ).limit(1).execute()
+        ).limit(1).maybe_single().execute()
 
-        if result.data and len(result.data) > 0:
-            row = result.data[0]
+        if result is not None:
+            row = result.data
             cloud_cover_frac = (row["cloud_cover"] or 0) / 100
             precipitation = row["precipitation"] or 0
             visibility_km = row["visibility_km"]
             fog = max(0, 1 - (visibility_km / 10)) if visibility_km and visibility_km < 10 else 0
 
-            return WeatherResponse(
+            # Fields come from the weather_forecast schema (numeric columns)
+            # and are computed here, so there is nothing left to validate
+            return WeatherResponse.model_construct(
                 cloudCover=round(cloud_cover_frac, 2),
                 precipitation=round(precipitation, 2),
                 fog=round(fog, 2),
@@ -203,11 +354,10 @@ async def get_weather_forecast(lat: float, lon: float, time_iso: str):
 @router.get("/weather/cache-stats")
 async def get_cache_stats():
     """Get cache statistics for debugging"""
-    now = time.time()
-    valid_entries = sum(1 for e in weather_cache.values() if now - e['timestamp'] < CACHE_TTL_SECONDS)
     return {
-        "total_entries": len(weather_cache),
-        "valid_entries": valid_entries,
+        "total_entries": weather_cache.stored_entries(),
+        "valid_entries": sum(1 for _ in weather_cache),  # iteration skips expired
+        "max_entries": weather_cache.maxsize,
         "cache_ttl_seconds": CACHE_TTL_SECONDS,
         "neighbor_radius_km": NEIGHBOR_RADIUS_KM
     }
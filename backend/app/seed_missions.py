@@ -8,12 +8,12 @@ Usage:
 """
 
 import os
-import time
+import asyncio
 from datetime import datetime
+import httpx
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from astroquery.jplhorizons import Horizons
-from astropy.time import Time
+from app.horizons import fetch_vector_table
 
 load_dotenv()
 
@@ -26,6 +26,10 @@ if not all([SUPABASE_URL, SUPABASE_KEY]):
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Trajectory queries in flight at once — enough to overlap round trips
+# without hammering Horizons
+HORIZONS_MAX_CONNECTIONS = 4
+
 # ── Mission configuration ──────────────────────────────────────────────
 # To add a new mission: append an entry with its NAIF ID, date range,
 # color, metadata, and flyby events, then re-run this script.
@@ -684,20 +688,20 @@ MISSIONS = [
 ]
 
 
-def fetch_trajectory(naif_id: str, start: str, stop: str, step: str) -> list[dict]:
+def epoch_date(calendar_date: str) -> str:
+    """'A.D. 1977-Sep-06 00:00:00.0000' -> '1977-09-06'."""
+    return datetime.strptime(calendar_date.split()[1], "%Y-%b-%d").strftime("%Y-%m-%d")
+
+
+async def fetch_trajectory(client: httpx.AsyncClient, naif_id: str, start: str, stop: str, step: str) -> list[dict]:
     """Fetch heliocentric trajectory waypoints from JPL Horizons."""
-    epochs = {"start": start, "stop": stop, "step": step}
-    obj = Horizons(id=naif_id, location="@sun", epochs=epochs)
-    vectors = obj.vectors()
+    rows = await fetch_vector_table(client, naif_id, "@sun", start, stop, step)
 
     waypoints = []
-    for i, row in enumerate(vectors):
-        jd = float(row["datetime_jd"])
-        t = Time(jd, format="jd")
-        epoch_date = t.datetime.strftime("%Y-%m-%d")
+    for i, row in enumerate(rows):
         waypoints.append({
             "waypoint_order": i,
-            "epoch": epoch_date,
+            "epoch": epoch_date(row["calendar_date"]),
             "x": float(row["x"]),
             "y": float(row["y"]),
             "z": float(row["z"]),
@@ -707,6 +711,17 @@ def fetch_trajectory(naif_id: str, start: str, stop: str, step: str) -> list[dic
     return waypoints
 
 
+async def fetch_all_trajectories(missions: list[dict]) -> dict[str, list[dict] | Exception]:
+    """Fetch every mission's trajectory concurrently; failed missions map to their exception."""
+    limits = httpx.Limits(max_connections=HORIZONS_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(limits=limits) as client:
+        results = await asyncio.gather(
+            *[fetch_trajectory(client, m["naif"], m["start"], m["stop"], m["step"]) for m in missions],
+            return_exceptions=True,
+        )
+    return {m["id"]: result for m, result in zip(missions, results)}
+
+
 def apply_flyby_labels(waypoints: list[dict], flybys: dict) -> list[dict]:
     """Assign labels and object_ids to waypoints closest to flyby dates."""
     for flyby_date_str, (label, object_id) in flybys.items():
@@ -728,17 +743,15 @@ def apply_flyby_labels(waypoints: list[dict], flybys: dict) -> list[dict]:
     return waypoints
 
 
-def seed_mission(config: dict):
-    """Seed a single mission."""
+def seed_mission(config: dict, waypoints: list[dict]):
+    """Seed a single mission from its fetched trajectory."""
     mission_id = config["id"]
     meta = config["meta"]
     print(f"\n{'='*50}")
     print(f"Seeding: {meta['name']} ({mission_id})")
 
     # 1. Trajectory from JPL Horizons
-    print(f"  Fetching trajectory from JPL Horizons (NAIF {config['naif']})...")
-    waypoints = fetch_trajectory(config["naif"], config["start"], config["stop"], config["step"])
-    print(f"  Got {len(waypoints)} waypoints")
+    print(f"  Got {len(waypoints)} waypoints (NAIF {config['naif']})")
 
     # 2. Apply flyby labels
     waypoints = apply_flyby_labels(waypoints, config.get("flybys", {}))
@@ -757,7 +770,7 @@ def seed_mission(config: dict):
         "color": config["color"],
         "sort_order": config["sort_order"],
     }
-    supabase.table("missions").upsert(mission_row).execute()
+    supabase.table("missions").upsert(mission_row, returning="minimal").execute()
     print(f"  Upserted mission row")
 
     # 4. Replace waypoints (delete old + insert new)
@@ -778,7 +791,7 @@ def seed_mission(config: dict):
     batch_size = 50
     for i in range(0, len(wp_rows), batch_size):
         batch = wp_rows[i : i + batch_size]
-        supabase.table("mission_waypoints").insert(batch).execute()
+        supabase.table("mission_waypoints").insert(batch, returning="minimal").execute()
     print(f"  Inserted {len(wp_rows)} waypoints")
 
 
@@ -789,10 +802,15 @@ def main():
     print(f"Missions to seed: {len(MISSIONS)}")
     print("=" * 50)
 
+    print("Fetching trajectories from JPL Horizons...")
+    trajectories = asyncio.run(fetch_all_trajectories(MISSIONS))
+
     for config in MISSIONS:
         try:
-            seed_mission(config)
-            time.sleep(1)  # Be polite to Horizons
+            waypoints = trajectories[config["id"]]
+            if isinstance(waypoints, Exception):
+                raise waypoints
+            seed_mission(config, waypoints)
         except Exception as e:
             print(f"  ERROR seeding {config['id']}: {e}")
             import traceback
@@ -0,0 +1,120 @@
+-- Partition weather_forecast by day (UTC) so past forecasts are dropped a
+-- whole partition at a time instead of with a row-by-row DELETE.
+-- refresh_forecast.py creates upcoming partitions via
+-- rpc('create_weather_forecast_partitions') and removes past days via
+-- rpc('drop_past_weather_forecast_partitions').
+
+BEGIN;
+
+ALTER TABLE weather_forecast RENAME TO weather_forecast_unpartitioned;
+
+CREATE TABLE weather_forecast (
+  id UUID DEFAULT gen_random_uuid() NOT NULL,
+  lat_grid DECIMAL(5,1) NOT NULL,
+  lon_grid DECIMAL(5,1) NOT NULL,
+  forecast_time TIMESTAMPTZ NOT NULL,
+  cloud_cover DECIMAL(5,2),       -- 0-100 (percentage)
+  precipitation DECIMAL(5,2),     -- mm
+  visibility_km DECIMAL(6,2),
+  updated_at TIMESTAMPTZ DEFAULT NOW() NOT NULL
+) PARTITION BY RANGE (forecast_time);
+
+-- One partition per UTC day in [from_day, to_day], named weather_forecast_pYYYYMMDD
+CREATE OR REPLACE FUNCTION public.create_weather_forecast_partitions(from_day DATE, to_day DATE)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  d DATE;
+  part TEXT;
+BEGIN
+  FOR d IN SELECT generate_series(from_day, to_day, INTERVAL '1 day')::date LOOP
+    part := 'weather_forecast_p' || to_char(d, 'YYYYMMDD');
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS %I PARTITION OF weather_forecast FOR VALUES FROM (%L) TO (%L)',
+      part,
+      d::timestamp AT TIME ZONE 'UTC',
+      (d + 1)::timestamp AT TIME ZONE 'UTC'
+    );
+    -- Only reachable through the parent table (and its policies), never directly via the API
+    EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', part);
+    EXECUTE format('REVOKE ALL ON %I FROM anon, authenticated', part);
+  END LOOP;
+END;
+$$;
+
+-- Detach and drop every partition for a UTC day before today; returns the count
+CREATE OR REPLACE FUNCTION public.drop_past_weather_forecast_partitions()
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  part RECORD;
+  dropped integer := 0;
+BEGIN
+  FOR part IN
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.weather_forecast'::regclass
+      AND c.relname ~ '^weather_forecast_p[0-9]{8}$'
+      AND to_date(right(c.relname, 8), 'YYYYMMDD') < (NOW() AT TIME ZONE 'UTC')::date
+  LOOP
+    EXECUTE format('ALTER TABLE weather_forecast DETACH PARTITION %I', part.relname);
+    EXECUTE format('DROP TABLE %I', part.relname);
+    dropped := dropped + 1;
+  END LOOP;
+  RETURN dropped;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.create_weather_forecast_partitions(DATE, DATE) FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.drop_past_weather_forecast_partitions() FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.create_weather_forecast_partitions(DATE, DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION public.drop_past_weather_forecast_partitions() TO service_role;
+
+-- Carry over forecasts from today onwards; past rows are dropped with the old table
+SELECT public.create_weather_forecast_partitions(
+  (NOW() AT TIME ZONE 'UTC')::date,
+  GREATEST(
+    (NOW() AT TIME ZONE 'UTC')::date,
+    (SELECT MAX(forecast_time AT TIME ZONE 'UTC')::date FROM weather_forecast_unpartitioned)
+  )
+);
+
+INSERT INTO weather_forecast
+  (id, lat_grid, lon_grid, forecast_time, cloud_cover, precipitation, visibility_km, updated_at)
+SELECT id, lat_grid, lon_grid, forecast_time, cloud_cover, precipitation, visibility_km, updated_at
+FROM weather_forecast_unpartitioned
+WHERE forecast_time >= (NOW() AT TIME ZONE 'UTC')::date::timestamp AT TIME ZONE 'UTC';
+
+DROP TABLE weather_forecast_unpartitioned;
+
+-- Unique keys on a partitioned table must include the partition key
+ALTER TABLE weather_forecast ADD PRIMARY KEY (id, forecast_time);
+ALTER TABLE weather_forecast ADD CONSTRAINT weather_forecast_lat_grid_lon_grid_forecast_time_key
+  UNIQUE (lat_grid, lon_grid, forecast_time);
+
+-- No separate (lat_grid, lon_grid) index. /weather/forecast looks up one cell's
+-- next forecast (WHERE lat_grid = ? AND lon_grid = ? AND forecast_time >= ?
+-- ORDER BY forecast_time LIMIT 1), which the unique key's btree answers with a
+-- single range scan and no sort; its (lat_grid, lon_grid) prefix covers any
+-- coordinate-only lookup, so another index would only slow every upsert.
+CREATE INDEX IF NOT EXISTS idx_forecast_time ON weather_forecast(forecast_time);
+
+-- Enable Row Level Security (public read, service role write)
+ALTER TABLE weather_forecast ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Weather forecast is publicly readable"
+  ON weather_forecast FOR SELECT
+  USING (true);
+
+CREATE POLICY "Service role can manage weather forecast"
+  ON weather_forecast FOR ALL
+  USING (auth.role() = 'service_role');
+
+COMMIT;
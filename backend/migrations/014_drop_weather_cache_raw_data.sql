@@ -0,0 +1,5 @@
+-- weather_cache.raw_data held the full upstream API response for debugging.
+-- No code reads it, and no code writes weather_cache rows any more (the API
+-- caches current weather in memory), so the column only costs storage.
+
+ALTER TABLE weather_cache DROP COLUMN IF EXISTS raw_data;
@@ -0,0 +1,29 @@
+"""Tests for application settings (config.py)."""
+
+from app.config import Settings, get_settings
+
+
+class TestCorsOrigins:
+    def test_parses_comma_separated_env(self, monkeypatch):
+        monkeypatch.setenv("CORS_ORIGINS", "https://a.example, https://b.example,")
+        settings = Settings(frontend_url="https://a.example")
+        assert settings.cors_origins == ["https://a.example", "https://b.example"]
+
+    def test_appends_frontend_url(self):
+        settings = Settings(cors_origins="https://a.example", frontend_url="https://app.example")
+        assert settings.cors_origins == ["https://a.example", "https://app.example"]
+
+    def test_accepts_list(self):
+        settings = Settings(cors_origins=["https://a.example"], frontend_url="")
+        assert settings.cors_origins == ["https://a.example"]
+
+    def test_default_list_not_shared(self, monkeypatch):
+        monkeypatch.delenv("CORS_ORIGINS", raising=False)
+        Settings(_env_file=None, frontend_url="https://app.example")
+        settings = Settings(_env_file=None, frontend_url="")
+        assert settings.cors_origins == ["http://localhost:5173", "http://localhost:3000"]
+
+
+class TestGetSettings:
+    def test_cached(self):
+        assert get_settings() is get_settings()
@@ -0,0 +1,190 @@
+"""Tests for the local DE440s ephemeris (ephemeris.py)."""
+
+import numpy as np
+import pytest
+from numpy.polynomial import chebyshev
+import app.ephemeris as ephemeris
+from app.ephemeris import (
+    Ephemeris,
+    chebyshev_states,
+    observer_data,
+    apparent_magnitude,
+    ICRF_TO_ECLIPTIC,
+    OBLIQUITY_J2000,
+    SPEED_OF_LIGHT_AU_DAY,
+    AU_KM,
+)
+
+JD = 2460749.5
+
+
+class FakeSegment:
+    """Single linear interval centered on JD: position at JD, constant velocity."""
+
+    def __init__(self, center: int, target: int, position, velocity, intlen: float = 8.0):
+        self.center = center
+        self.target = target
+        self.intlen = intlen
+        # T0 coefficient = position at the midpoint, T1 = velocity * intlen/2
+        self.coefficients = np.zeros((3, 1, 2))
+        self.coefficients[:, 0, 0] = position
+        self.coefficients[:, 0, 1] = np.array(velocity, dtype=float) * intlen / 2
+        self.loads = 0
+
+    def load_array(self):
+        self.loads += 1
+        return JD - self.intlen / 2, self.intlen, self.coefficients
+
+
+class FakeKernel:
+    def __init__(self, segments):
+        self.segments = segments
+
+
+def _kernel() -> FakeKernel:
+    # Sun, Earth-Moon barycenter, Earth and Moon, all in km / km/day
+    return FakeKernel([
+        FakeSegment(0, 10, [1000, 0, 0], [0, 1, 0]),
+        FakeSegment(0, 3, [AU_KM, 0, 0], [0, 100, 0]),
+        FakeSegment(3, 399, [-10, 0, 0], [0, 0, 0]),
+        FakeSegment(3, 301, [0, 0, 384400], [0, 0, 0]),
+    ])
+
+
+class TestSupports:
+    def test_planets_in_kernel(self):
+        ephemeris = Ephemeris(_kernel())
+        assert ephemeris.supports("399", "@sun")
+        assert ephemeris.supports("301", "@399")
+
+    def test_bodies_missing_from_kernel(self):
+        ephemeris = Ephemeris(_kernel())
+        assert not ephemeris.supports("606", "@699")  # Titan: not in DE440s
+        assert not ephemeris.supports("499", "@sun")  # not in the fake kernel
+
+
+class TestChebyshevStates:
+    def test_matches_numpy_chebval(self):
+        rng = np.random.default_rng(0)
+        # Two segments of different degree and interval length
+        arrays = [
+            (JD - 20.0, 16.0, rng.normal(size=(3, 4, 13))),
+            (JD - 3.0, 32.0, rng.normal(size=(3, 2, 9))),
+        ]
+        positions, velocities = chebyshev_states(arrays, JD)
+
+        for i, (initial_epoch, intlen, coefficients) in enumerate(arrays):
+            index, offset = divmod(JD - initial_epoch, intlen)
+            s = 2 * offset / intlen - 1
+            c = coefficients[:, int(index), :]
+            for component in range(3):
+                expected_p = chebyshev.chebval(s, c[component])
+                expected_v = chebyshev.chebval(s, chebyshev.chebder(c[component])) * 2 / intlen
+                assert positions[i, component] == pytest.approx(expected_p)
+                assert velocities[i, component] == pytest.approx(expected_v)
+
+    def test_segment_end_uses_last_interval(self):
+        coefficients = np.zeros((3, 2, 2))
+        coefficients[:, 1, 0] = 5.0
+        coefficients[:, 1, 1] = 1.0
+        positions, _ = chebyshev_states([(JD - 16.0, 8.0, coefficients)], JD)
+        assert positions[0].tolist() == pytest.approx([6.0, 6.0, 6.0])
+
+    def test_outside_coverage_raises(self):
+        with pytest.raises(ValueError, match="outside ephemeris coverage"):
+            chebyshev_states([(JD + 1, 8.0, np.zeros((3, 1, 2)))], JD)
+
+
+class TestVectors:
+    def test_heliocentric_chain(self):
+        v = Ephemeris(_kernel()).vectors({"earth": ("399", "@sun")}, JD)["earth"]
+        # EMB + Earth offset - Sun, rotated into the ecliptic (x axis unchanged)
+        assert v["x"] == pytest.approx((AU_KM - 10 - 1000) / AU_KM)
+        assert v["y"] == pytest.approx(0)
+
+    def test_rotates_into_ecliptic(self):
+        v = Ephemeris(_kernel()).vectors({"moon": ("301", "@399")}, JD)["moon"]
+        expected = ICRF_TO_ECLIPTIC @ np.array([10, 0, 384400]) / AU_KM
+        assert [v["x"], v["y"], v["z"]] == pytest.approx(expected.tolist())
+        # The celestial pole sits 23.4 deg from the ecliptic pole, towards +y
+        assert 0 < v["y"] < v["z"]
+
+    def test_velocity_in_au_per_day(self):
+        v = Ephemeris(_kernel()).vectors({"earth": ("399", "@sun")}, JD)["earth"]
+        assert np.hypot(v["vy"], v["vz"]) == pytest.approx(99 / AU_KM)
+
+    def test_unsupported_targets_left_out(self):
+        vectors = Ephemeris(_kernel()).vectors({
+            "earth": ("399", "@sun"),
+            "titan": ("606", "@699"),
+        }, JD)
+        assert set(vectors) == {"earth"}
+
+    def test_segment_arrays_loaded_once(self):
+        kernel = _kernel()
+        ephemeris = Ephemeris(kernel)
+        targets = {"earth": ("399", "@sun"), "moon": ("301", "@sun")}
+        ephemeris.vectors(targets, JD)
+        ephemeris.vectors(targets, JD)
+        sun = kernel.segments[0]
+        assert sun.loads == 1
+
+
+def _state(x=0.0, y=0.0, z=0.0, vx=0.0, vy=0.0, vz=0.0) -> dict:
+    return {"x": x, "y": y, "z": z, "vx": vx, "vy": vy, "vz": vz}
+
+
+EARTH = _state(x=1.0)
+
+
+class TestObserverData:
+    def test_vernal_equinox_direction(self):
+        e = observer_data(_state(x=2.0), EARTH, "499")
+        assert e["ra"] == pytest.approx(0)
+        assert e["dec"] == pytest.approx(0)
+        assert e["distance_au"] == pytest.approx(1.0)
+        assert e["distance_km"] == pytest.approx(AU_KM)
+
+    def test_ecliptic_y_axis_is_north_of_equator(self):
+        e = observer_data(_state(x=1.0, y=1.0), EARTH, "499")
+        assert e["ra"] == pytest.approx(90)
+        assert e["dec"] == pytest.approx(np.degrees(OBLIQUITY_J2000))
+
+    def test_ra_wraps_to_positive(self):
+        e = observer_data(_state(x=1.0, y=-1.0), EARTH, "499")
+        assert e["ra"] == pytest.approx(270)
+
+    def test_light_time_correction(self):
+        # Body 1 AU away moving at 1 AU/day along y
+        e = observer_data(_state(x=2.0, vy=1.0), EARTH, "499")
+        light_time = 1 / SPEED_OF_LIGHT_AU_DAY
+        # Seen light_time days earlier, displaced along -y (foreshortened into RA)
+        expected = np.degrees(np.arctan2(-light_time * np.cos(OBLIQUITY_J2000), 1.0)) % 360
+        assert e["ra"] == pytest.approx(expected)
+
+
+class TestApparentMagnitude:
+    def test_sun_at_one_au(self):
+        assert apparent_magnitude("10", np.zeros(3), np.array([-1.0, 0, 0])) == pytest.approx(-26.74)
+
+    def test_opposition_has_no_phase_term(self):
+        # Mars at 1.5 AU from the Sun, 0.5 AU from Earth, fully lit
+        magnitude = apparent_magnitude("499", np.array([1.5, 0, 0]), np.array([0.5, 0, 0]))
+        assert magnitude == pytest.approx(-1.52 + 5 * np.log10(1.5 * 0.5), abs=1e-3)
+
+    def test_phase_dims_body(self):
+        full = apparent_magnitude("499", np.array([1.5, 0, 0]), np.array([0.5, 0, 0]))
+        quarter = apparent_magnitude("499", np.array([0, 1.5, 0]), np.array([-1.0, 1.5, 0]))
+        assert quarter > full
+
+    def test_unlisted_body_is_none(self):
+        assert apparent_magnitude("2000001", np.array([2.7, 0, 0]), np.array([1.7, 0, 0])) is None
+
+
+class TestLoadEphemeris:
+    def test_missing_kernel_falls_back_without_download(self, tmp_path, monkeypatch):
+        downloads = []
+        monkeypatch.setattr(ephemeris, "KERNEL_PATH", str(tmp_path / "missing.bsp"))
+        monkeypatch.setattr(ephemeris.httpx, "stream", lambda *args, **kwargs: downloads.append(args))
+        assert ephemeris.load_ephemeris() is None
+        assert downloads == []
@@ -0,0 +1,132 @@
+"""Tests for the JPL Horizons API client (horizons.py)."""
+
+import asyncio
+import httpx
+import pytest
+import app.horizons as horizons
+from app.horizons import (
+    fetch_vectors,
+    parse_table,
+    parse_vectors,
+    parse_vector_table,
+    result_text,
+    vector_params,
+    vector_range_params,
+    VECTOR_PARAMS,
+)
+
+
+VECTORS_RESULT = """\
+*******************************************************************************
+Ephemeris / API_USER Sat Mar 15 00:00:00 2025 Pasadena, USA      / Horizons
+*******************************************************************************
+Target body name: Mars (499)                      {source: mar099}
+Center body name: Sun (10)                        {source: DE441}
+*******************************************************************************
+            JDTDB,            Calendar Date (TDB),                      X,                      Y,                      Z,                     VX,                     VY,                     VZ,
+**************************************************************************************************************************************************************************************************
+$$SOE
+2460749.500000000, A.D. 2025-Mar-15 00:00:00.0000, -1.161412456512345E+00,  1.216213981234567E+00,  5.407402312345678E-02, -9.866734567891234E-03, -8.663812345678901E-03,  6.201234567890123E-05,
+$$EOE
+**************************************************************************************************************************************************************************************************
+"""
+
+
+class TestParseTable:
+    def test_maps_columns_to_values(self):
+        rows = parse_table(VECTORS_RESULT)
+        assert len(rows) == 1
+        assert rows[0]["JDTDB"] == "2460749.500000000"
+        assert rows[0]["Calendar Date (TDB)"] == "A.D. 2025-Mar-15 00:00:00.0000"
+
+    def test_raises_without_ephemeris_block(self):
+        with pytest.raises(ValueError, match="No ephemeris"):
+            parse_table("No matches found.")
+
+
+class TestParseVectors:
+    def test_parses_state_vector(self):
+        v = parse_vectors(VECTORS_RESULT)
+        assert v["x"] == pytest.approx(-1.161412456512345)
+        assert v["y"] == pytest.approx(1.216213981234567)
+        assert v["z"] == pytest.approx(0.05407402312345678)
+        assert v["vx"] == pytest.approx(-0.009866734567891234)
+        assert v["vz"] == pytest.approx(6.201234567890123e-05)
+
+
+class TestParseVectorTable:
+    def test_includes_epoch_per_row(self):
+        rows = parse_vector_table(VECTORS_RESULT)
+        assert len(rows) == 1
+        assert rows[0]["jd"] == pytest.approx(2460749.5)
+        assert rows[0]["calendar_date"] == "A.D. 2025-Mar-15 00:00:00.0000"
+        assert rows[0]["x"] == pytest.approx(-1.161412456512345)
+
+
+class TestResultText:
+    def test_unwraps_result(self):
+        assert result_text({"result": VECTORS_RESULT}) == VECTORS_RESULT
+
+    def test_raises_on_api_error(self):
+        with pytest.raises(ValueError, match="Horizons error"):
+            result_text({"error": "Cannot interpret date.\n"})
+
+
+class TestParams:
+    def test_vector_params_quote_ids(self):
+        params = vector_params("599", "@sun", 2460749.5)
+        assert params["COMMAND"] == "'599'"
+        assert params["CENTER"] == "'@sun'"
+        assert params["EPHEM_TYPE"] == "VECTORS"
+        assert params["TLIST"] == "'2460749.5'"
+        assert params["format"] == "json"
+        assert params["TIME_TYPE"] == "TDB"
+
+    def test_template_not_mutated(self):
+        vector_params("599", "@sun", 2460749.5)
+        assert "COMMAND" not in VECTOR_PARAMS
+        assert "TLIST" not in VECTOR_PARAMS
+
+    def test_vector_range_params(self):
+        params = vector_range_params("-31", "@sun", "1977-09-06", "2025-01-01", "30d")
+        assert params["START_TIME"] == "'1977-09-06'"
+        assert params["STOP_TIME"] == "'2025-01-01'"
+        assert params["STEP_SIZE"] == "'30d'"
+        assert "TLIST" not in params
+
+
+class TestDiskCache:
+    def _client(self, calls: list, text: str = VECTORS_RESULT) -> httpx.AsyncClient:
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"result": text})
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def _fetch(self, calls: list, jd: float, text: str = VECTORS_RESULT):
+        async def run():
+            async with self._client(calls, text) as client:
+                return await fetch_vectors(client, "499", "@sun", jd)
+        return asyncio.run(run())
+
+    def test_repeat_query_served_from_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(horizons, "CACHE_DIR", str(tmp_path))
+        calls = []
+        first = self._fetch(calls, 2460749.5)
+        second = self._fetch(calls, 2460749.5)
+        assert first == second
+        assert len(calls) == 1
+
+    def test_different_epoch_misses_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(horizons, "CACHE_DIR", str(tmp_path))
+        calls = []
+        self._fetch(calls, 2460749.5)
+        self._fetch(calls, 2460749.501)  # ~1.4 min later: never served a nearby epoch
+        assert len(calls) == 2
+
+    def test_unparseable_response_not_cached(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(horizons, "CACHE_DIR", str(tmp_path))
+        calls = []
+        with pytest.raises(ValueError):
+            self._fetch(calls, 2460749.5, text="No matches found.")
+        self._fetch(calls, 2460749.5)
+        assert len(calls) == 2
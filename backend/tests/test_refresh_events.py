@@ -1,6 +1,8 @@
 """Tests for celestial event refresh logic (refresh_events.py)."""
 
+import asyncio
 from app.refresh_events import (
+    fetch_remote_events,
     get_meteor_shower_rows,
     get_lunar_eclipse_rows,
     fetch_usno_moon_phases,
@@ -209,3 +211,24 @@ class TestNOAAAuroraForecast:
     def test_storm_labels_complete(self):
         for scale in ["G1", "G2", "G3", "G4", "G5"]:
             assert scale in STORM_LABELS
+
+
+class TestFetchRemoteEvents:
+    @patch("app.refresh_events.fetch_noaa_aurora_forecast")
+    @patch("app.refresh_events.fetch_usno_moon_phases")
+    @patch("app.refresh_events.fetch_usno_solar_eclipses")
+    def test_combines_all_sources(self, mock_eclipses, mock_phases, mock_aurora):
+        mock_eclipses.side_effect = lambda year: [{"id": f"eclipse-{year}"}]
+        mock_phases.side_effect = lambda year: [{"id": f"phase-{year}"}]
+        mock_aurora.return_value = [{"id": "aurora"}]
+
+        rows = asyncio.run(fetch_remote_events(2025))
+        assert sorted(r["id"] for r in rows) == [
+            "aurora", "eclipse-2025", "eclipse-2026", "phase-2025", "phase-2026",
+        ]
+
+    @patch("app.refresh_events.fetch_noaa_aurora_forecast", return_value=[])
+    @patch("app.refresh_events.fetch_usno_moon_phases", return_value=[])
+    @patch("app.refresh_events.fetch_usno_solar_eclipses", return_value=[])
+    def test_empty_sources(self, *mocks):
+        assert asyncio.run(fetch_remote_events(2025)) == []
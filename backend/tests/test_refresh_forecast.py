@@ -1,22 +1,47 @@
 """Tests for weather forecast refresh logic (refresh_forecast.py)."""
 
-from app.refresh_forecast import generate_land_grid, parse_forecast_rows, GRID_RESOLUTION
-
-
-class TestGenerateLandGrid:
-    def test_returns_non_empty(self):
-        grid = generate_land_grid()
-        assert len(grid) > 0
+import asyncio
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from app.refresh_forecast import (
+    generate_global_grid,
+    parse_forecast_rows,
+    forecast_record,
+    chunk_location_rows,
+    GRID_RESOLUTION,
+    TokenBucket,
+)
+
+
+class TestGenerateGlobalGrid:
+    def test_returns_point_array(self):
+        grid = generate_global_grid()
+        assert grid.ndim == 2
+        assert grid.shape[1] == 2
+        assert np.issubdtype(grid.dtype, np.integer)
 
     def test_points_are_on_grid(self):
-        """All points should be multiples of GRID_RESOLUTION (5 degrees)."""
-        grid = generate_land_grid()
-        for lat, lon in grid:
+        """All points should be multiples of GRID_RESOLUTION (3 degrees)."""
+        grid = generate_global_grid()
+        for lat, lon in grid.tolist():
             assert lat % GRID_RESOLUTION == 0, f"lat {lat} not on grid"
             assert lon % GRID_RESOLUTION == 0, f"lon {lon} not on grid"
 
+    def test_skips_poles(self):
+        """Leaflet Mercator clips at ~85 degrees."""
+        grid = generate_global_grid()
+        assert grid[:, 0].min() == -84
+        assert grid[:, 0].max() == 84
+
+    def test_covers_full_longitude_range(self):
+        grid = generate_global_grid()
+        assert grid[:, 1].min() == -180
+        assert grid[:, 1].max() == 180
+
     def test_covers_major_continents(self):
-        grid = generate_land_grid()
+        grid = generate_global_grid().tolist()
         lats = {p[0] for p in grid}
         lons = {p[1] for p in grid}
         # North America
@@ -29,13 +54,18 @@ class TestGenerateLandGrid:
         assert any(-35 <= lat <= -15 for lat in lats)
 
     def test_no_duplicates(self):
-        grid = generate_land_grid()
-        assert len(grid) == len(set(grid))
+        grid = generate_global_grid()
+        assert len(grid) == len(np.unique(grid, axis=0))
+
+    def test_count(self):
+        """57 latitude rows (-84..84) x 121 longitude columns (-180..180)."""
+        grid = generate_global_grid()
+        assert len(grid) == 57 * 121
 
-    def test_reasonable_count(self):
-        """Should have a reasonable number of points (not too few, not millions)."""
-        grid = generate_land_grid()
-        assert 100 < len(grid) < 2000
+    def test_latitude_major_order(self):
+        grid = generate_global_grid()
+        assert grid[0].tolist() == [-84, -180]
+        assert grid[1].tolist() == [-84, -177]
 
 
 class TestParseForecastRows:
@@ -109,6 +139,28 @@ class TestParseForecastRows:
         # Should append timezone info
         assert "+00:00" in rows[0]["forecast_time"]
 
+    def test_keeps_existing_timezone(self):
+        data = {"hourly": {"time": ["2025-03-15T00:00+00:00"], "cloud_cover": [50]}}
+        rows = parse_forecast_rows(data, 0, 0)
+        assert rows[0]["forecast_time"] == "2025-03-15T00:00+00:00"
+
+    def test_rounds_to_two_decimals(self):
+        data = {
+            "hourly": {
+                "time": ["2025-03-15T00:00", "2025-03-15T01:00"],
+                "cloud_cover": [33.333, None],
+                "precipitation": [0.126, 2],
+                "visibility": [12346, 24140.0],
+            }
+        }
+        rows = parse_forecast_rows(data, 0, 0)
+        assert rows[0]["cloud_cover"] == 33.33
+        assert rows[0]["precipitation"] == 0.13
+        assert rows[0]["visibility_km"] == 12.35
+        assert rows[1]["cloud_cover"] is None
+        assert rows[1]["precipitation"] == 2.0
+        assert rows[1]["visibility_km"] == 24.14
+
     def test_updated_at_present(self):
         data = {
             "hourly": {
@@ -120,3 +172,54 @@ class TestParseForecastRows:
         }
         rows = parse_forecast_rows(data, 0, 0)
         assert "updated_at" in rows[0]
+
+
+class TestChunkLocationRows:
+    def test_groups_whole_locations_under_limit(self):
+        location_rows = [[{"i": i}] * 120 for i in range(20)]
+        chunks = chunk_location_rows(location_rows, max_rows=1000)
+        assert [count for count, _ in chunks] == [8, 8, 4]
+        assert all(len(rows) <= 1000 for _, rows in chunks)
+        assert sum(len(rows) for _, rows in chunks) == 20 * 120
+
+    def test_oversized_location_gets_own_chunk(self):
+        chunks = chunk_location_rows([[{}] * 5, [{}] * 20, [{}] * 5], max_rows=10)
+        assert [(count, len(rows)) for count, rows in chunks] == [(1, 5), (1, 20), (1, 5)]
+
+    def test_empty(self):
+        assert chunk_location_rows([]) == []
+
+
+class TestForecastRecord:
+    def test_orders_columns_for_upsert(self):
+        data = {"hourly": {"time": ["2024-01-15T00:00"], "cloud_cover": [50],
+                           "precipitation": [0.1], "visibility": [24000]}}
+        row = parse_forecast_rows(data, 42, -87)[0]
+        record = forecast_record(row)
+        assert record[:2] == (42, -87)
+        assert record[2] == datetime(2024, 1, 15, tzinfo=timezone.utc)
+        assert record[3:6] == (50, 0.1, 24.0)
+        assert isinstance(record[6], datetime)
+
+
+class TestTokenBucket:
+    def test_burst_is_immediate(self):
+        async def run():
+            bucket = TokenBucket(rate=1, capacity=50)
+            start = time.monotonic()
+            await bucket.acquire(50)
+            return time.monotonic() - start
+        assert asyncio.run(run()) < 0.05
+
+    def test_waits_for_refill(self):
+        async def run():
+            bucket = TokenBucket(rate=100, capacity=10)
+            await bucket.acquire(10)
+            start = time.monotonic()
+            await bucket.acquire(5)  # needs 5 tokens at 100/s → ~50ms
+            return time.monotonic() - start
+        assert 0.03 < asyncio.run(run()) < 0.5
+
+    def test_rejects_request_larger_than_capacity(self):
+        with pytest.raises(ValueError):
+            asyncio.run(TokenBucket(rate=1, capacity=10).acquire(11))
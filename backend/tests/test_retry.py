@@ -0,0 +1,82 @@
+"""Tests for the outbound HTTP retry policy (retry.py)."""
+
+import asyncio
+import httpx
+import pytest
+import app.retry as retry
+from app.retry import backoff_delay, is_retryable, get_with_retry
+
+
+def _status_error(status: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.com")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class TestIsRetryable:
+    def test_rate_limit_and_server_errors(self):
+        assert is_retryable(_status_error(429))
+        assert is_retryable(_status_error(503))
+
+    def test_client_errors_not_retried(self):
+        assert not is_retryable(_status_error(400))
+        assert not is_retryable(_status_error(404))
+
+    def test_transport_errors(self):
+        assert is_retryable(httpx.ConnectError("boom"))
+        assert is_retryable(httpx.ReadTimeout("slow"))
+
+
+class TestBackoffDelay:
+    def test_grows_exponentially(self):
+        assert 1 <= backoff_delay(0) < 2
+        assert 4 <= backoff_delay(2) < 5
+
+    def test_capped_at_maximum(self):
+        assert backoff_delay(20, maximum=60) == 60
+
+    def test_honours_retry_after(self):
+        response = httpx.Response(429, headers={"Retry-After": "7"})
+        assert backoff_delay(0, response) == 7
+
+    def test_retry_after_capped_at_maximum(self):
+        response = httpx.Response(429, headers={"Retry-After": "86400"})
+        assert backoff_delay(0, response, maximum=60) == 60
+
+    def test_ignores_unparseable_retry_after(self):
+        response = httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        assert 1 <= backoff_delay(0, response) < 2
+
+
+class TestGetWithRetry:
+    @pytest.fixture(autouse=True)
+    def no_sleep(self, monkeypatch):
+        async def fake_sleep(seconds):
+            pass
+        monkeypatch.setattr(retry.asyncio, "sleep", fake_sleep)
+
+    def _get(self, statuses: list[int], **kwargs) -> tuple[httpx.Response, int]:
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return await get_with_retry(client, "https://example.com", **kwargs)
+
+        return asyncio.run(run()), len(calls)
+
+    def test_retries_until_success(self):
+        response, calls = self._get([503, 429, 200])
+        assert response.status_code == 200
+        assert calls == 3
+
+    def test_gives_up_after_max_attempts(self):
+        with pytest.raises(httpx.HTTPStatusError):
+            self._get([503], max_attempts=3)
+
+    def test_does_not_retry_client_errors(self):
+        with pytest.raises(httpx.HTTPStatusError):
+            self._get([404, 200])
@@ -1,6 +1,31 @@
 """Tests for mission seeding logic (seed_missions.py)."""
 
-from app.seed_missions import apply_flyby_labels, MISSIONS
+import asyncio
+import app.seed_missions as seed_missions
+from app.seed_missions import apply_flyby_labels, epoch_date, fetch_all_trajectories, MISSIONS
+
+
+class TestFetchAllTrajectories:
+    def test_maps_results_and_failures_by_mission(self, monkeypatch):
+        async def fake_fetch_vector_table(client, naif_id, center, start, stop, step):
+            if naif_id == "-31":
+                raise ValueError("Horizons error")
+            return [{"calendar_date": f"A.D. {start[:4]}-Jan-01 00:00:00.0000", "x": 1, "y": 2, "z": 3}]
+
+        monkeypatch.setattr(seed_missions, "fetch_vector_table", fake_fetch_vector_table)
+        missions = [m for m in MISSIONS if m["naif"] in ("-31", "-98")]
+        results = asyncio.run(fetch_all_trajectories(missions))
+
+        assert isinstance(results["voyager-1"], ValueError)
+        assert results["new-horizons"] == [{
+            "waypoint_order": 0, "epoch": "2006-01-01",
+            "x": 1.0, "y": 2.0, "z": 3.0, "label": None, "object_id": None,
+        }]
+
+
+class TestEpochDate:
+    def test_parses_horizons_calendar_date(self):
+        assert epoch_date("A.D. 1977-Sep-06 00:00:00.0000") == "1977-09-06"
 
 
 class TestApplyFlybyLabels:
@@ -1,43 +1,63 @@
 """Tests for weather API endpoints."""
 
-import time
-from unittest.mock import AsyncMock, patch
+import math
+import asyncio
+import httpx
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+import app.routers.weather as weather
 from app.routers.weather import (
-    haversine_distance,
+    unit_vectors,
+    NEIGHBOR_RADIUS_KM,
+    EARTH_RADIUS_KM,
     cache_key,
     find_nearest_cached,
+    cached_transport,
+    WeatherCache,
+    get_supabase,
     parse_open_meteo_response,
-    weather_cache,
 )
 
 
 # ── Unit tests for helper functions ──────────────────────────────────────────
 
 
-class TestHaversineDistance:
-    def test_same_point_is_zero(self):
-        assert haversine_distance(51.5, -0.12, 51.5, -0.12) == 0.0
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Reference great-circle distance in km, to check the KD-tree lookup against"""
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
 
-    def test_london_to_paris(self):
-        # ~340 km
-        dist = haversine_distance(51.5074, -0.1278, 48.8566, 2.3522)
-        assert 330 < dist < 350
 
-    def test_symmetry(self):
-        d1 = haversine_distance(0, 0, 10, 10)
-        d2 = haversine_distance(10, 10, 0, 0)
-        assert abs(d1 - d2) < 0.001
+class TestUnitVectors:
+    def test_axes(self):
+        assert np.allclose(unit_vectors(0, 0), [1, 0, 0])
+        assert np.allclose(unit_vectors(0, 90), [0, 1, 0])
+        assert np.allclose(unit_vectors(90, 0), [0, 0, 1])
+
+    def test_arrays_are_unit_length(self):
+        xyz = unit_vectors(np.array([51.5, -33.87]), np.array([-0.12, 151.21]))
+        assert xyz.shape == (2, 3)
+        assert np.allclose(np.linalg.norm(xyz, axis=1), 1)
 
 
 class TestCacheKey:
     def test_rounds_to_one_decimal(self):
-        assert cache_key(51.5074, -0.1278) == "51.5,-0.1"
+        assert cache_key(51.5074, -0.1278) == (515, -1)
 
     def test_exact_values(self):
-        assert cache_key(10.0, 20.0) == "10.0,20.0"
+        assert cache_key(10.0, 20.0) == (100, 200)
 
     def test_negative_coords(self):
-        assert cache_key(-33.87, 151.21) == "-33.9,151.2"
+        assert cache_key(-33.87, 151.21) == (-339, 1512)
+
+    def test_nearby_points_share_key(self):
+        assert cache_key(51.501, -0.104) == cache_key(51.54, -0.06)
+        assert all(isinstance(v, int) for v in cache_key(51.5, -0.1))
 
 
 class TestParseOpenMeteoResponse:
@@ -87,50 +107,251 @@ class TestParseOpenMeteoResponse:
         assert result["temperature_c"] is None
 
 
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _entry(lat: float, lon: float, data: dict | None = None) -> dict:
+    return {"data": data if data is not None else {}, "lat": lat, "lon": lon}
+
+
 class TestFindNearestCached:
-    def setup_method(self):
-        weather_cache.clear()
+    @pytest.fixture(autouse=True)
+    def cache(self, monkeypatch):
+        self.clock = FakeClock()
+        self.cache = WeatherCache(timer=self.clock)
+        monkeypatch.setattr(weather, "weather_cache", self.cache)
 
     def test_returns_none_when_empty(self):
         assert find_nearest_cached(51.5, -0.12) is None
 
     def test_finds_nearby_entry(self):
-        weather_cache["51.5,-0.1"] = {
-            "data": {"cloudCover": 0.5, "precipitation": 0, "fog": 0,
-                     "visibility_km": 10, "temperature_c": 15, "lat": 51.5, "lon": -0.1},
-            "timestamp": time.time(),
-            "lat": 51.5,
-            "lon": -0.1,
-        }
+        self.cache[(515, -1)] = _entry(51.5, -0.1, {
+            "cloudCover": 0.5, "precipitation": 0, "fog": 0,
+            "visibility_km": 10, "temperature_c": 15, "lat": 51.5, "lon": -0.1,
+        })
         result = find_nearest_cached(51.51, -0.11)
         assert result is not None
 
     def test_ignores_expired_entries(self):
-        weather_cache["51.5,-0.1"] = {
-            "data": {},
-            "timestamp": time.time() - 7200,  # 2 hours ago (past 1h TTL)
-            "lat": 51.5,
-            "lon": -0.1,
-        }
+        self.cache[(515, -1)] = _entry(51.5, -0.1)
+        self.clock.now += 7200  # 2 hours later (past 1h TTL)
         assert find_nearest_cached(51.5, -0.1) is None
 
     def test_ignores_far_entries(self):
-        weather_cache["0.0,0.0"] = {
-            "data": {},
-            "timestamp": time.time(),
-            "lat": 0.0,
-            "lon": 0.0,
-        }
+        self.cache[(0, 0)] = _entry(0.0, 0.0)
         # London is >5000 km from (0,0) — well outside 50km radius
         assert find_nearest_cached(51.5, -0.12) is None
 
-    def teardown_method(self):
-        weather_cache.clear()
+    def test_picks_closest_of_several(self):
+        for lat, lon in [(51.7, -0.1), (51.5, -0.1), (51.3, -0.1)]:
+            self.cache[cache_key(lat, lon)] = _entry(lat, lon, {"lat": lat})
+        assert find_nearest_cached(51.52, -0.1)["data"] == {"lat": 51.5}
+
+    def test_evicts_expired_entries(self):
+        self.cache[(515, -1)] = _entry(51.5, -0.1)
+        self.clock.now += 7200
+        self.cache[(100, 100)] = _entry(10.0, 10.0)
+        # The expired entry is nearest, which triggers eviction
+        assert find_nearest_cached(51.5, -0.1) is None
+        assert list(self.cache) == [(100, 100)]
+        assert len(self.cache) == 1
+
+    def test_skips_expired_nearest_for_valid_neighbor(self):
+        self.cache[(515, -1)] = _entry(51.5, -0.1)
+        self.clock.now += 7200
+        self.cache[(516, -1)] = _entry(51.6, -0.1, {"fresh": True})
+        assert find_nearest_cached(51.5, -0.1)["data"] == {"fresh": True}
+
+    def test_radius_boundary(self):
+        # 0.4 deg of latitude is ~44 km, 0.5 deg ~56 km
+        self.cache[(0, 0)] = _entry(0.0, 0.0)
+        assert find_nearest_cached(0.4, 0.0) is not None
+        assert find_nearest_cached(0.5, 0.0) is None
+
+    def test_replaced_entry_moves(self):
+        self.cache[(0, 0)] = _entry(0.0, 0.0)
+        assert find_nearest_cached(0.0, 0.0) is not None
+        self.cache[(0, 0)] = _entry(40.0, 0.0)
+        assert find_nearest_cached(0.0, 0.0) is None
+        assert find_nearest_cached(40.0, 0.0) is not None
+
+    def test_sees_entries_added_after_lookup(self):
+        assert find_nearest_cached(51.5, -0.1) is None
+        self.cache[(515, -1)] = _entry(51.5, -0.1)
+        assert find_nearest_cached(51.5, -0.1) is not None
+
+    def test_cache_stats_do_not_evict(self, client):
+        self.cache[(0, 0)] = _entry(0.0, 0.0)
+        self.clock.now += 3000
+        self.cache[(100, 100)] = _entry(10.0, 10.0)
+        self.clock.now += 1000  # first entry now expired, second still valid
+        stats = client.get("/api/weather/cache-stats").json()
+        assert (stats["total_entries"], stats["valid_entries"]) == (2, 1)
+        assert self.cache.stored_entries() == 2
+
+    def test_size_bound_evicts_from_index(self, monkeypatch):
+        cache = WeatherCache(maxsize=2, timer=self.clock)
+        monkeypatch.setattr(weather, "weather_cache", cache)
+        cache[(0, 0)] = _entry(0.0, 0.0)
+        cache[(400, 0)] = _entry(40.0, 0.0)
+        cache[(-400, 0)] = _entry(-40.0, 0.0)
+        assert len(cache) == 2
+        assert find_nearest_cached(0.0, 0.0) is None
+        assert find_nearest_cached(-40.0, 0.0) is not None
+
+
+class TestWeatherCacheIndex:
+    def test_matches_brute_force_across_rebuilds(self, monkeypatch):
+        # Small threshold so lookups mix tree hits, pending points and
+        # superseded tree entries
+        monkeypatch.setattr(weather, "INDEX_REBUILD_THRESHOLD", 5)
+        cache = WeatherCache()
+        rng = np.random.default_rng(0)
+        for step in range(300):
+            lat, lon = rng.uniform(50, 52), rng.uniform(-1, 1)
+            key = cache_key(lat, lon)
+            if step % 7 == 0 and key in cache:
+                del cache[key]
+            else:
+                cache[key] = _entry(lat, lon)
+
+            q_lat, q_lon = rng.uniform(50, 52), rng.uniform(-1, 1)
+            distances = {k: haversine_distance(q_lat, q_lon, e["lat"], e["lon"]) for k, e in cache.items()}
+            within = {k: d for k, d in distances.items() if d < NEIGHBOR_RADIUS_KM}
+            expected = min(within, key=within.get) if within else None
+            assert cache.nearest(q_lat, q_lon, NEIGHBOR_RADIUS_KM) == expected
+
+    def test_insert_does_not_rebuild_tree(self):
+        cache = WeatherCache()
+        cache[(0, 0)] = _entry(0.0, 0.0)
+        cache.nearest(0.0, 0.0, NEIGHBOR_RADIUS_KM)
+        tree = cache._tree
+        cache[(400, 0)] = _entry(40.0, 0.0)
+        assert cache.nearest(40.0, 0.0, NEIGHBOR_RADIUS_KM) == (400, 0)
+        assert cache._tree is tree
+
+
+class TestCachedTransport:
+    def _get_twice(self, tmp_path, monkeypatch, headers: dict) -> int:
+        monkeypatch.setattr(weather, "HTTP_CACHE_PATH", str(tmp_path / "cache.db"))
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"current": {}}, headers=headers)
+
+        async def run():
+            for _ in range(2):
+                transport = cached_transport(httpx.MockTransport(handler))
+                async with httpx.AsyncClient(transport=transport) as client:
+                    response = await client.get("https://api.open-meteo.com/v1/forecast?latitude=1")
+                    assert response.json() == {"current": {}}
+
+        asyncio.run(run())
+        return len(calls)
+
+    def test_fresh_response_served_from_disk(self, tmp_path, monkeypatch):
+        assert self._get_twice(tmp_path, monkeypatch, {"Cache-Control": "max-age=600"}) == 1
+
+    def test_uncacheable_response_refetched(self, tmp_path, monkeypatch):
+        assert self._get_twice(tmp_path, monkeypatch, {"Cache-Control": "no-store"}) == 2
 
 
 # ── Integration tests via TestClient ─────────────────────────────────────────
 
 
+class TestHttpClientLifespan:
+    def test_one_client_for_app_lifetime(self, client):
+        http_client = client.app.state.http_client
+        assert isinstance(http_client, httpx.AsyncClient)
+        assert not http_client.is_closed
+        client.get("/api/weather/cache-stats")
+        assert client.app.state.http_client is http_client
+
+
+class TestCachedResponses:
+    RAW = {"current": {"cloud_cover": 40, "precipitation": 0.2, "temperature_2m": 12.5},
+           "hourly": {"visibility": [8000]}}
+
+    def test_cache_and_neighbor_hits_match_api_response(self, client, monkeypatch):
+        monkeypatch.setattr(weather, "weather_cache", WeatherCache())
+        with patch("app.routers.weather.fetch_weather_from_open_meteo",
+                   AsyncMock(return_value=self.RAW)) as fetch:
+            api = client.get("/api/weather?lat=12.0&lon=34.0").json()
+            cached = client.get("/api/weather?lat=12.0&lon=34.0").json()
+            neighbor = client.get("/api/weather?lat=12.2&lon=34.0").json()
+        assert fetch.await_count == 1
+        assert [api["source"], cached["source"], neighbor["source"]] == ["api", "cache", "neighbor"]
+        strip = lambda body: {k: v for k, v in body.items() if k != "source"}
+        assert strip(cached) == strip(api) == strip(neighbor)
+
+
+class TestSingleFlight:
+    @pytest.fixture(autouse=True)
+    def cache(self, monkeypatch):
+        monkeypatch.setattr(weather, "weather_cache", WeatherCache())
+
+    def _concurrent(self, fetch, n: int = 5) -> list:
+        async def run():
+            with patch("app.routers.weather.fetch_weather_from_open_meteo", fetch):
+                return await asyncio.gather(
+                    *(weather.get_weather(12.0, 34.0, client=None) for _ in range(n)),
+                    return_exceptions=True,
+                )
+        return asyncio.run(run())
+
+    def test_concurrent_misses_share_one_fetch(self):
+        async def slow_fetch(client, lat, lon):
+            await asyncio.sleep(0.01)
+            return TestCachedResponses.RAW
+
+        fetch = AsyncMock(side_effect=slow_fetch)
+        responses = self._concurrent(fetch)
+        assert fetch.await_count == 1
+        assert {r.source for r in responses} == {"api"}
+        assert weather._in_flight == {}
+
+    def test_failure_reaches_every_waiter(self):
+        fetch = AsyncMock(side_effect=httpx.ConnectError("down"))
+        responses = self._concurrent(fetch)
+        assert fetch.await_count == 1
+        assert all(isinstance(r, HTTPException) and r.status_code == 502 for r in responses)
+        assert weather._in_flight == {}
+
+
+class TestForecastEndpoint:
+    def _get(self, client, row):
+        sb = MagicMock()
+        query = sb.table.return_value.select.return_value.eq.return_value.eq.return_value
+        query.gte.return_value.order.return_value.limit.return_value.maybe_single.return_value \
+            .execute.return_value = None if row is None else MagicMock(data=row)
+        client.app.dependency_overrides[get_supabase] = lambda: sb
+        try:
+            return client.get("/api/weather/forecast?lat=51.5&lon=-0.1&time_iso=2026-01-01T00:00:00Z")
+        finally:
+            client.app.dependency_overrides.clear()
+
+    def test_returns_forecast_row(self, client):
+        res = self._get(client, {"cloud_cover": 40, "precipitation": 1, "visibility_km": 5,
+                                 "forecast_time": "2026-01-01T00:00:00+00:00"})
+        assert res.status_code == 200
+        assert res.json() == {"cloudCover": 0.4, "precipitation": 1.0, "fog": 0.5, "visibility_km": 5.0,
+                              "temperature_c": None, "source": "forecast", "lat": 51.5, "lon": -0.1}
+
+    def test_missing_row_404(self, client):
+        assert self._get(client, None).status_code == 404
+
+
+class TestGetSupabase:
+    def test_client_reused_across_calls(self):
+        assert get_supabase() is get_supabase()
+
+
 class TestWeatherEndpoint:
     def test_returns_weather_data(self, client):
         """Hit the real Open-Meteo API (free, no key) and verify response shape."""